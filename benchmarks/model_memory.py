@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2021-2024 Jason Morley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import argparse
+import datetime
+import gc
+import mimetypes
+import os
+import random
+import sys
+import tracemalloc
+import uuid
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.append(ROOT_DIRECTORY)
+
+import model
+
+
+# The original event model, which gives every instance a `__dict__` and an eagerly generated identifier.
+class ReferenceEvent(object):
+
+    def __init__(self, date, person):
+        self.id = str(uuid.uuid4())
+        self.date = date
+        self.person = person
+
+
+class ReferenceMessage(ReferenceEvent):
+
+    def __init__(self, type, date, person, content):
+        super().__init__(date, person)
+        self.type = type
+        self.content = content
+
+
+class ReferenceAttachment(ReferenceEvent):
+
+    def __init__(self, date, person, content):
+        super().__init__(date=date, person=person)
+        self.content = content
+
+    @property
+    def mimetype(self):
+        return mimetypes.guess_type(self.content)[0]
+
+
+class ReferenceImage(ReferenceAttachment):
+
+    def __init__(self, date, person, content, size):
+        super().__init__(date=date, person=person, content=content)
+        self.size = size
+
+
+REFERENCE_MODEL = {
+    "message": ReferenceMessage,
+    "attachment": ReferenceAttachment,
+    "image": ReferenceImage,
+}
+
+SLOTS_MODEL = {
+    "message": model.Message,
+    "attachment": model.Attachment,
+    "image": model.Image,
+}
+
+
+# Returns the arguments for a representative mix of events; these are allocated up front, so that only the events
+# themselves are measured.
+def arguments(count, seed=0):
+    generator = random.Random(seed)
+    people = [model.Person(name=f"person{index}@example.com", is_primary=index == 0) for index in range(10)]
+    start = datetime.datetime(2010, 1, 1, tzinfo=datetime.timezone.utc)
+    for index in range(count):
+        date = start + datetime.timedelta(seconds=index * 7)
+        person = generator.choice(people)
+        kind = generator.choices(["message", "attachment", "image"], weights=[90, 5, 5])[0]
+        if kind == "message":
+            yield kind, dict(type=model.EventType.MESSAGE, date=date, person=person, content=f"<p>message {index}</p>")
+        elif kind == "attachment":
+            yield kind, dict(date=date, person=person, content=f"{index:064x}.pdf")
+        else:
+            yield kind, dict(date=date, person=person, content=f"{index:064x}.jpg", size=(640, 480))
+
+
+def measure(classes, sample, touch):
+    gc.collect()
+    tracemalloc.start()
+    events = [classes[kind](**kwargs) for kind, kwargs in sample]
+    if touch:
+        for event in events:
+            event.id
+            getattr(event, "mimetype", None)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size / len(events)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the memory used per event against the original model.")
+    parser.add_argument("--events", type=int, default=200000, help="number of events to allocate")
+    options = parser.parse_args()
+
+    sample = list(arguments(options.events))
+    for touch, description in [(False, "after import"), (True, "with identifiers")]:
+        reference = measure(REFERENCE_MODEL, sample, touch=touch)
+        slots = measure(SLOTS_MODEL, sample, touch=touch)
+        print(f"{description}: {reference:.0f} bytes/event -> {slots:.0f} bytes/event "
+              f"({100 * (1 - slots / reference):.0f}% smaller)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2021-2024 Jason Morley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import argparse
+import collections
+import datetime
+import importlib.util
+import io
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import struct
+import sys
+import tempfile
+import time
+import zipfile
+import zlib
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.append(ROOT_DIRECTORY)
+
+import model
+import search_index
+import store
+
+import importers.msn_messenger
+import importers.received_files
+import importers.text_archive
+import importers.whatsapp_ios
+
+spec = importlib.util.spec_from_file_location("chat_history", os.path.join(ROOT_DIRECTORY, "chat-history.py"))
+chat_history = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(chat_history)
+
+
+# Increment whenever the generated corpus changes, so that results are only compared against comparable baselines.
+CORPUS_VERSION = 1
+
+FORMATS = ["whatsapp_ios", "msn_messenger", "text_archive", "received_files"]
+
+IMPORTERS = {
+    "whatsapp_ios": importers.whatsapp_ios,
+    "msn_messenger": importers.msn_messenger,
+    "text_archive": importers.text_archive,
+    "received_files": importers.received_files,
+}
+
+# Proportion of WhatsApp messages that are attachments; received files are generated at the same proportion of the
+# message count.
+ATTACHMENT_RATIO = 0.02
+
+MESSAGES_PER_SESSION = 200
+
+START_DATE = datetime.datetime(2004, 1, 1, 9, 0, 0)
+
+WORDS = ["hello", "there", "how's", "it", "going?", "see", "you", "later", "tomorrow", "lunch", "café", "naïve",
+         "日本語", "ok", "thanks!", "www.example.com", ":-)", ":(", "(H)", "🙂", "👍🏻", "&", "<tag>", "the", "a", "and"]
+
+PRIMARY_NAME = "Me"
+PRIMARY_EMAIL = "me@example.com"
+
+
+def contact_name(contact):
+    return f"Contact {contact}"
+
+
+def contact_email(contact):
+    return f"contact{contact}@example.com"
+
+
+def create_people(contacts):
+    result = model.People()
+    for index, identities in itertools.chain([(None, [PRIMARY_NAME, PRIMARY_EMAIL])],
+                                             ((contact, [contact_name(contact), contact_email(contact)])
+                                              for contact in range(contacts))):
+        person = model.Person(name=identities[0], is_primary=index is None)
+        person.id = model.stable_id("person", "name", person.name)
+        for identity in identities:
+            result.people[identity] = person
+    return result
+
+
+# Minimal PNG (signature and header chunk) with the given dimensions; `index` makes the contents of every image, and
+# therefore its content-addressed attachment, unique.
+def png(width, height, index):
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" +
+            struct.pack(">I", len(header)) + b"IHDR" + header +
+            struct.pack(">I", zlib.crc32(b"IHDR" + header)) +
+            struct.pack(">I", 4) + b"tEXt" + struct.pack(">I", index) + struct.pack(">I", 0))
+
+
+def text(generator):
+    return " ".join(generator.choice(WORDS) for _ in range(generator.randint(1, 16)))
+
+
+# Yields the (date, is_primary) pairs of `count` messages, in order.
+def timeline(generator, start, count):
+    date = start
+    for _ in range(count):
+        date = date + datetime.timedelta(seconds=generator.randint(1, 600))
+        yield date, generator.random() < 0.5
+
+
+# Each generator writes one source of `count` messages between the primary person and `contact` to `directory`,
+# returning its path. Every source is generated from its own seeded random number generator, so the corpus is
+# deterministic for a given seed.
+
+def write_whatsapp_ios(directory, generator, index, contact, start, count):
+    path = os.path.join(directory, f"WhatsApp Chat {index:05d}.zip")
+    with zipfile.ZipFile(path, "w") as archive, io.StringIO() as fh:
+        for ordinal, (date, is_primary) in enumerate(timeline(generator, start, count)):
+            name = PRIMARY_NAME if is_primary else contact_name(contact)
+            if generator.random() < ATTACHMENT_RATIO:
+                basename = f"{ordinal:08d}-PHOTO-{date:%Y-%m-%d-%H-%M-%S}.png"
+                archive.writestr(basename, png(generator.randint(1, 4096), generator.randint(1, 4096), ordinal))
+                content = f"‎<attached: {basename}>"
+            else:
+                content = text(generator)
+            fh.write(f"[{date:%d/%m/%Y, %H:%M:%S}] {name}: {content}\n")
+        archive.writestr("_chat.txt", fh.getvalue())
+    return path
+
+
+def write_msn_messenger(directory, generator, index, contact, start, count):
+    path = os.path.join(directory, f"{contact_email(contact)}-{index:05d}.xml")
+    with open(path, "w", encoding="utf-8") as fh:
+        fh.write('<?xml version="1.0"?>\n<Log FirstSessionID="1" LastSessionID="1">\n')
+        for date, is_primary in timeline(generator, start, count):
+            logon_name, friendly_name = ((PRIMARY_EMAIL, PRIMARY_NAME) if is_primary
+                                         else (contact_email(contact), contact_name(contact)))
+            content = text(generator).replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+            fh.write(f'<Message DateTime="{date:%Y-%m-%dT%H:%M:%S}.000Z" SessionID="1">'
+                     f'<From><User LogonName="{logon_name}" FriendlyName="{friendly_name}"/></From>'
+                     f'<To><User FriendlyName="{friendly_name}"/></To>'
+                     f'<Text Style="font-family:Arial">{content}</Text></Message>\n')
+        fh.write("</Log>\n")
+    return path
+
+
+def write_text_archive(directory, generator, index, contact, start, count):
+    path = os.path.join(directory, f"Chat Log {index:05d}.txt")
+    separator = importers.text_archive.SEPARATOR
+    with open(path, "w", encoding="utf-8") as fh:
+        for session in range(0, count, MESSAGES_PER_SESSION):
+            session_start = start + datetime.timedelta(days=session // MESSAGES_PER_SESSION)
+            fh.write(f"{separator}\n"
+                     f"| Session Start: {session_start:%d %B %Y} |\n"
+                     f"| Participants: |\n"
+                     f"|    {contact_name(contact)} ({contact_email(contact)}) |\n"
+                     f"|    {PRIMARY_NAME} ({PRIMARY_EMAIL}) |\n"
+                     f"{separator}\n")
+            for date, is_primary in timeline(generator, session_start, min(MESSAGES_PER_SESSION, count - session)):
+                name = PRIMARY_NAME if is_primary else contact_name(contact)
+                fh.write(f"[{date:%H:%M:%S}] {name}: {text(generator)}\n")
+                if generator.random() < 0.05:
+                    fh.write(f"        {text(generator)}\n")
+    return path
+
+
+def write_received_files(directory, generator, index, contact, start, count):
+    path = os.path.join(directory, f"Received Files {index:05d}")
+    user_path = os.path.join(path, contact_email(contact))
+    os.makedirs(user_path)
+    for ordinal, (date, _) in enumerate(timeline(generator, start, count)):
+        file_path = os.path.join(user_path, f"{ordinal:08d}.png")
+        with open(file_path, "wb") as fh:
+            fh.write(png(generator.randint(1, 4096), generator.randint(1, 4096), ordinal))
+        timestamp = date.replace(tzinfo=datetime.timezone.utc).timestamp()
+        os.utime(file_path, (timestamp, timestamp))
+    return path
+
+
+WRITERS = {
+    "whatsapp_ios": write_whatsapp_ios,
+    "msn_messenger": write_msn_messenger,
+    "text_archive": write_text_archive,
+    "received_files": write_received_files,
+}
+
+
+# Generates the corpus in `directory`, or reuses it if it was generated with the same parameters, returning the paths
+# of the sources for each format.
+def corpus(directory, parameters):
+    manifest_path = os.path.join(directory, "corpus.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as fh:
+            manifest = json.load(fh)
+        if manifest["parameters"] == parameters:
+            logging.info("Using existing corpus in '%s'.", directory)
+            return manifest["sources"]
+        raise SystemExit(f"Corpus in '{directory}' was generated with different parameters.")
+
+    sources = {}
+    for format in parameters["formats"]:
+        format_directory = os.path.join(directory, format)
+        os.makedirs(format_directory, exist_ok=True)
+        messages = parameters["messages"]
+        if format == "received_files":
+            messages = max(1, int(messages * ATTACHMENT_RATIO))
+        logging.info("Generating %d %s messages...", messages, format)
+        paths = []
+        for index, offset in enumerate(range(0, messages, parameters["messages_per_source"])):
+            generator = random.Random(f"{parameters['seed']}-{format}-{index}")
+            contact = index % parameters["contacts"]
+            start = START_DATE + datetime.timedelta(days=index * 7)
+            count = min(parameters["messages_per_source"], messages - offset)
+            paths.append(WRITERS[format](format_directory, generator, index, contact, start, count))
+        sources[format] = paths
+
+    with open(manifest_path, "w") as fh:
+        json.dump({"parameters": parameters, "sources": sources}, fh, indent=2)
+    return sources
+
+
+class Benchmark(object):
+
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.stages = {}
+
+    # Runs `function` `repeat` times, recording the fastest run, and returns the result of the last run. `setup` is
+    # called (untimed) before each run.
+    def run(self, name, function, items, setup=None):
+        durations = []
+        for _ in range(self.repeat):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            result = function()
+            durations.append(time.perf_counter() - start)
+        seconds = min(durations)
+        count = items(result) if callable(items) else items
+        self.stages[name] = {"seconds": seconds,
+                             "items": count,
+                             "items_per_second": count / seconds if seconds > 0 else None}
+        logging.info("%s: %.3fs (%d items, %s items/s)", name, seconds, count,
+                     "-" if seconds == 0 else f"{count / seconds:.0f}")
+        return result
+
+
+def event_count(sessions):
+    return sum(len(session.events) for session in sessions)
+
+
+def import_format(importer, sources, people, attachments_directory):
+    sessions = []
+    for path in sources:
+        context = model.ImportContext(people=people)
+        source_sessions = importer.import_messages(context, attachments_directory, path)
+        model.identify_events(path, itertools.chain.from_iterable(session.events for session in source_sessions))
+        sessions.extend(source_sessions)
+    return sessions
+
+
+def reset_directory(path):
+    chat_history.remove_stale_files(os.path.dirname(path), os.path.basename(path), set())
+    os.makedirs(path)
+
+
+def run_pipeline(benchmark, sources, contacts, output_directory):
+    attachments_directory = os.path.join(output_directory, "attachments")
+    data_directory = os.path.join(output_directory, "data")
+    os.makedirs(attachments_directory, exist_ok=True)
+    chat_history.OUTPUT_DATA_DIRECTORY = data_directory
+    chat_history.OUTPUT_EXPORT_DIRECTORY = os.path.join(data_directory, "conversations")
+    chat_history.OUTPUT_SEARCH_DIRECTORY = os.path.join(data_directory, "search")
+    chat_history.TEMPLATES_CACHE_DIRECTORY = os.path.join(output_directory, "templates")
+
+    # Import.
+    people = create_people(contacts)
+    imported_sessions = []
+    for format, paths in sources.items():
+        imported_sessions.extend(benchmark.run(f"import_messages.{format}",
+                                               lambda: import_format(IMPORTERS[format], paths, people,
+                                                                     attachments_directory),
+                                               event_count))
+    sizes = images_sizes(attachments_directory, imported_sessions)
+    sessions = []
+    for session in imported_sessions:
+        events = list(chat_history.detect_videos(chat_history.detect_images(sizes, session.events)))
+        sessions.append(model.Session(sources=session.sources, people=session.people, events=events))
+
+    # Merge.
+    threads = collections.defaultdict(list)
+    for session in sessions:
+        threads[chat_history.hash_identifiers(session.people)].append(session)
+    threads = list(threads.values())
+    events = benchmark.run("merge_events",
+                           lambda: [list(chat_history.merge_events([session.events for session in thread]))
+                                    for thread in threads],
+                           lambda result: sum(len(thread_events) for thread_events in result))
+    sessions = [model.Session(sources=list(itertools.chain.from_iterable(session.sources for session in thread)),
+                              people=list(dict.fromkeys(itertools.chain.from_iterable(session.people
+                                                                                      for session in thread))),
+                              events=thread_events)
+                for thread, thread_events in zip(threads, events)]
+    batches = benchmark.run("group_events",
+                            lambda: [list(chat_history.group_events(session.people, session.events))
+                                     for session in sessions],
+                            lambda result: sum(len(session_batches) for session_batches in result))
+    conversations = sorted((model.Conversation(sources=session.sources, people=session.people, batches=session_batches)
+                            for session, session_batches in zip(sessions, batches)),
+                           key=lambda conversation: conversation.name)
+    events = sum(len(batch.events) for conversation in conversations for batch in conversation.batches)
+
+    # Render (from scratch each time).
+    def render():
+        with chat_history.RenderManifest(os.path.join(data_directory, "manifest.json")) as manifest:
+            return chat_history.render_conversations(conversations, 1, manifest)
+
+    def reset_output():
+        if os.path.exists(data_directory):
+            reset_directory(data_directory)
+        else:
+            os.makedirs(data_directory)
+
+    benchmark.run("render", render, events, setup=reset_output)
+    benchmark.run("search_index",
+                  lambda: search_index.write_index(chat_history.OUTPUT_SEARCH_DIRECTORY,
+                                                   [(conversation.id, chat_history.export_terms_path(conversation))
+                                                    for conversation in conversations]),
+                  events,
+                  setup=lambda: reset_directory(chat_history.OUTPUT_SEARCH_DIRECTORY))
+
+    # Load an empty database.
+    database_path = os.path.join(output_directory, "messages.sqlite")
+
+    def load():
+        with store.Store(database_path) as database:
+            with database.bulk_load(), database.transaction() as transaction:
+                return transaction.update(set(people.people.values()), conversations)
+
+    def remove_database():
+        for suffix in ["", "-wal", "-shm", "-journal"]:
+            if os.path.exists(database_path + suffix):
+                os.remove(database_path + suffix)
+
+    benchmark.run("store", load, lambda summary: summary.written, setup=remove_database)
+
+
+def images_sizes(directory, sessions):
+    return chat_history.images.SizeCache().lookup(directory, {event.content
+                                                              for session in sessions
+                                                              for event in session.events
+                                                              if chat_history.is_image(event)})
+
+
+# Returns the stages that are slower than their baseline by more than `threshold` (as a proportion), and by more than
+# `tolerance` seconds, so that noise in very short stages isn't reported.
+def compare(results, baseline, threshold, tolerance):
+    regressions = []
+    print(f"{'stage':<32} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, stage in results["stages"].items():
+        if name not in baseline["stages"]:
+            print(f"{name:<32} {'-':>10} {stage['seconds']:>9.3f}s {'':>8}")
+            continue
+        previous = baseline["stages"][name]["seconds"]
+        change = stage["seconds"] / previous - 1 if previous > 0 else 0.0
+        is_regression = change > threshold and stage["seconds"] - previous > tolerance
+        if is_regression:
+            regressions.append(name)
+        print(f"{name:<32} {previous:>9.3f}s {stage['seconds']:>9.3f}s {change:>+7.0%}{' !' if is_regression else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time each importer and pipeline stage against a synthetic corpus, "
+                                                 "optionally comparing the results against a baseline.")
+    parser.add_argument("--messages", type=int, default=10000, help="number of messages to generate for each format")
+    parser.add_argument("--messages-per-source", type=int, default=5000, help="number of messages in each source")
+    parser.add_argument("--contacts", type=int, default=10, help="number of people to generate conversations with")
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=FORMATS, help="formats to generate")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the corpus")
+    parser.add_argument("--corpus", help="directory to generate the corpus in, and reuse it from on subsequent runs")
+    parser.add_argument("--repeat", type=int, default=1, help="number of times to run each stage (the fastest is used)")
+    parser.add_argument("--output", help="write the results to this file as JSON")
+    parser.add_argument("--baseline", help="compare the results against the results in this file")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="proportion by which a stage can be slower than the baseline before failing (default 0.1)")
+    parser.add_argument("--tolerance", type=float, default=0.05,
+                        help="seconds by which a stage can be slower than the baseline before failing (default 0.05)")
+    parser.add_argument("--verbose", "-v", action="store_true", default=False, help="verbose logging")
+    options = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.DEBUG if options.verbose else logging.INFO)
+
+    parameters = {"version": CORPUS_VERSION,
+                  "messages": options.messages,
+                  "messages_per_source": options.messages_per_source,
+                  "contacts": options.contacts,
+                  "formats": options.formats,
+                  "seed": options.seed}
+    benchmark = Benchmark(repeat=options.repeat)
+    with tempfile.TemporaryDirectory() as directory:
+        corpus_directory = options.corpus or os.path.join(directory, "corpus")
+        os.makedirs(corpus_directory, exist_ok=True)
+        sources = corpus(corpus_directory, parameters)
+        run_pipeline(benchmark, sources, options.contacts, os.path.join(directory, "output"))
+
+    results = {"parameters": parameters,
+               "python": platform.python_version(),
+               "platform": platform.platform(),
+               "stages": benchmark.stages}
+    if options.output:
+        with open(options.output, "w") as fh:
+            json.dump(results, fh, indent=2)
+
+    if options.baseline:
+        with open(options.baseline) as fh:
+            baseline = json.load(fh)
+        if baseline["parameters"] != parameters:
+            raise SystemExit(f"Baseline '{options.baseline}' was generated with different parameters.")
+        regressions = compare(results, baseline, options.threshold, options.tolerance)
+        if regressions:
+            raise SystemExit(f"Regressed by more than {options.threshold:.0%}: {', '.join(regressions)}.")
+
+
+if __name__ == '__main__':
+    main()
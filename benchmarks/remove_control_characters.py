@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2021-2024 Jason Morley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import argparse
+import os
+import random
+import sys
+import timeit
+import unicodedata
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.append(ROOT_DIRECTORY)
+
+import utilities
+
+
+# The original implementation, which classifies each character with `unicodedata.category`.
+def remove_control_characters_reference(s):
+    s = "".join(ch for ch in s if unicodedata.category(ch)[0] != "C")
+    return s.replace("\xa0", " ")
+
+
+def lines(count, seed=0):
+    generator = random.Random(seed)
+    words = ["hello", "there", "how's", "it", "going?", "café", "naïve", "🙂", "👍🏻", "‎", "‏", "\xa0", "\t",
+             "‪", "﻿", "日本語", "\U000e0067"]
+    for i in range(count):
+        text = " ".join(generator.choice(words) for _ in range(generator.randint(1, 20)))
+        yield f"‎[29/06/2022, 15:25:{i % 60:02d}] Jason Morley: {text}\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare control character removal against the original implementation.")
+    parser.add_argument("--lines", type=int, default=100000, help="number of chat lines to process")
+    parser.add_argument("--repeat", type=int, default=5, help="number of timing repetitions")
+    options = parser.parse_args()
+
+    sample = list(lines(options.lines))
+    for line in sample:
+        assert utilities.remove_control_characters(line) == remove_control_characters_reference(line), repr(line)
+
+    reference = min(timeit.repeat(lambda: [remove_control_characters_reference(line) for line in sample],
+                                  number=1, repeat=options.repeat))
+    table = min(timeit.repeat(lambda: [utilities.remove_control_characters(line) for line in sample],
+                              number=1, repeat=options.repeat))
+    print(f"Output matches for {options.lines} lines.")
+    print(f"unicodedata.category: {reference:.3f}s")
+    print(f"str.translate:        {table:.3f}s ({reference / table:.1f}x faster)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+# Copyright (c) 2021-2024 Jason Morley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import model
+import utilities
+
+
+# Increment whenever changes to the model invalidate previously serialized sessions.
+VERSION = 3
+
+SESSIONS_FILENAME = "sessions.pickle"
+ATTACHMENTS_DIRECTORY = "attachments"
+DIGESTS_FILENAME = "digests.json"
+
+
+def files(path):
+    if os.path.isfile(path):
+        return [path]
+    result = []
+    for root, directories, filenames in os.walk(path):
+        directories.sort()
+        result.extend(os.path.join(root, filename) for filename in sorted(filenames))
+    return result
+
+
+class SessionCache(object):
+
+    def __init__(self, path, media_destination_path):
+        self.path = path
+        self.media_destination_path = media_destination_path
+        self.hits = 0
+        self.misses = 0
+        self.keys = set()
+        os.makedirs(self.path, exist_ok=True)
+        self.digests = {}
+        try:
+            with open(os.path.join(self.path, DIGESTS_FILENAME)) as fh:
+                self.digests = json.load(fh)
+        except (OSError, ValueError):
+            pass
+        self.used_digests = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.prune()
+        self.close()
+
+    def digest(self, path):
+        # Content digests are only recomputed when the size or modification time of a file changes.
+        stat = os.stat(path)
+        signature = [stat.st_size, stat.st_mtime_ns]
+        cached = self.digests.get(path)
+        if cached is not None and cached[:2] == signature:
+            digest = cached[2]
+        else:
+            digest = utilities.file_digest(path)
+        self.used_digests[path] = signature + [digest]
+        return signature, digest
+
+    def key(self, importer, path):
+        path = os.path.abspath(path)
+        components = [VERSION, importer.__name__, importer.VERSION, path]
+        for f in files(path):
+            signature, digest = self.digest(f)
+            components.append([os.path.relpath(f, path)] + signature + [digest])
+        return hashlib.sha256(json.dumps(components).encode("utf-8")).hexdigest()
+
+    def lookup(self, importer, path):
+        key = self.key(importer, path)
+        self.keys.add(key)
+        entry_path = os.path.join(self.path, key)
+        if os.path.isdir(entry_path):
+            try:
+                data = self.load(entry_path)
+                self.hits += 1
+                logging.debug("Using cached sessions for '%s'.", path)
+                return key, data
+            except OSError as e:
+                logging.warning("Ignoring invalid cache entry for '%s' (%s).", path, e)
+                shutil.rmtree(entry_path, ignore_errors=True)
+        self.misses += 1
+        return key, None
+
+    # Called when the sessions returned by `lookup` can't be deserialized (e.g., a truncated entry), so that the source
+    # is re-imported and the entry replaced.
+    def discard(self, key, path, error):
+        logging.warning("Ignoring invalid cache entry for '%s' (%s).", path, error)
+        shutil.rmtree(os.path.join(self.path, key), ignore_errors=True)
+        self.hits -= 1
+        self.misses += 1
+
+    def load(self, entry_path):
+        with open(os.path.join(entry_path, SESSIONS_FILENAME), "rb") as fh:
+            data = fh.read()
+        attachments_path = os.path.join(entry_path, ATTACHMENTS_DIRECTORY)
+        for basename in os.listdir(attachments_path):
+            destination = os.path.join(self.media_destination_path, basename)
+            if not os.path.exists(destination):
+                utilities.place_file(os.path.join(attachments_path, basename), destination)
+        return data
+
+    def store(self, key, data, basenames):
+        entry_path = os.path.join(self.path, key)
+        if os.path.isdir(entry_path):
+            return
+        temporary_path = tempfile.mkdtemp(dir=self.path, prefix=".")
+        try:
+            attachments_path = os.path.join(temporary_path, ATTACHMENTS_DIRECTORY)
+            os.makedirs(attachments_path)
+            for basename in basenames:
+                utilities.place_file(os.path.join(self.media_destination_path, basename),
+                                     os.path.join(attachments_path, basename))
+            with open(os.path.join(temporary_path, SESSIONS_FILENAME), "wb") as fh:
+                fh.write(data)
+            os.rename(temporary_path, entry_path)
+        except OSError as e:
+            logging.warning("Unable to cache sessions (%s).", e)
+            shutil.rmtree(temporary_path, ignore_errors=True)
+
+    def prune(self):
+        # Remove entries (including stale temporary directories) that weren't used by this import.
+        for name in os.listdir(self.path):
+            entry_path = os.path.join(self.path, name)
+            if os.path.isdir(entry_path) and name not in self.keys:
+                logging.debug("Removing unused cache entry '%s'...", name)
+                shutil.rmtree(entry_path, ignore_errors=True)
+        self.digests = self.used_digests
+
+    def close(self):
+        with open(os.path.join(self.path, DIGESTS_FILENAME), "w") as fh:
+            json.dump(self.digests | self.used_digests, fh)
+        logging.info("Import cache: %d hits, %d misses.", self.hits, self.misses)
+
+
+def attachments(sessions):
+    return {event.content
+            for session in sessions
+            for event in session.events
+            if event.type == model.EventType.ATTACHMENT}
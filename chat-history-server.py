@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2021-2024 Jason Morley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import argparse
+import base64
+import email.utils
+import hashlib
+import http
+import http.server
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import urllib.parse
+
+import store
+
+
+DEFAULT_DATABASE_PATH = os.path.expanduser("~/.chat-history/data/messages.sqlite")
+
+DEFAULT_LIMIT = 100
+MAXIMUM_LIMIT = 1000
+
+EVENTS_PATH_EXPRESSION = re.compile(r"^/conversations/([^/]+)/events$")
+
+
+verbose = '--verbose' in sys.argv[1:] or '-v' in sys.argv[1:]
+logging.basicConfig(level=logging.DEBUG if verbose else logging.INFO, format="[%(levelname)s] %(message)s")
+
+
+class BadRequest(Exception):
+    pass
+
+
+class NotFound(Exception):
+    pass
+
+
+# Cursors are opaque to clients; they encode the (timestamp, id) of the last event on the previous page.
+def encode_cursor(position):
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise BadRequest(f"Invalid cursor '{cursor}'.")
+    if not isinstance(position, list) or len(position) != 2 or not all(isinstance(value, str) for value in position):
+        raise BadRequest(f"Invalid cursor '{cursor}'.")
+    return tuple(position)
+
+
+def integer_parameter(parameters, name, default, minimum=0, maximum=None):
+    try:
+        value = int(parameters.get(name, default))
+    except ValueError:
+        raise BadRequest(f"Invalid {name} '{parameters[name]}'.")
+    if maximum is None and value < minimum:
+        raise BadRequest(f"{name} must be at least {minimum}.")
+    if maximum is not None and not minimum <= value <= maximum:
+        raise BadRequest(f"{name} must be between {minimum} and {maximum}.")
+    return value
+
+
+def record_json(record):
+    return {"id": record.id, "name": record.name}
+
+
+def event_json(event):
+    return {"id": event.id,
+            "type": event.type,
+            "timestamp": event.timestamp,
+            "person": event.person,
+            "content": json.loads(event.content).get("content")}
+
+
+# Each handler takes a connection and the query parameters, validates them (raising `BadRequest` or `NotFound`), and
+# returns a function which runs the query and returns a JSON-serializable response. Requests are validated before
+# conditional requests are answered, so invalid requests are never answered with '304 Not Modified'.
+
+def get_people(connection, parameters):
+    return lambda: [record_json(person) for person in store.people(connection)]
+
+
+def get_conversations(connection, parameters):
+    return lambda: [record_json(conversation) for conversation in store.conversations(connection)]
+
+
+def get_events(connection, parameters, conversation):
+    if store.conversation(connection, conversation) is None:
+        raise NotFound(f"Unknown conversation '{conversation}'.")
+    before = decode_cursor(parameters["before"]) if "before" in parameters else None
+    limit = integer_parameter(parameters, "limit", DEFAULT_LIMIT, minimum=1, maximum=MAXIMUM_LIMIT)
+
+    def response():
+        page = store.events(connection, conversation, before=before, limit=limit)
+        return {"events": [event_json(event) for event in page.events],
+                "next": encode_cursor(page.next) if page.next is not None else None}
+
+    return response
+
+
+def get_search(connection, parameters):
+    if not parameters.get("q"):
+        raise BadRequest("Missing query.")
+    limit = integer_parameter(parameters, "limit", DEFAULT_LIMIT, minimum=1, maximum=MAXIMUM_LIMIT)
+    offset = integer_parameter(parameters, "offset", 0)
+
+    # FTS5 queries can only be validated by running them.
+    try:
+        results = store.search(connection, parameters["q"],
+                               conversation=parameters.get("conversation"), limit=limit, offset=offset)
+    except sqlite3.OperationalError as e:
+        raise BadRequest(f"Invalid query ({e}).")
+    return lambda: [result._asdict() for result in results]
+
+
+def route(path):
+    if path == "/people":
+        return get_people, []
+    elif path == "/conversations":
+        return get_conversations, []
+    elif path == "/search":
+        return get_search, []
+    match = EVENTS_PATH_EXPRESSION.match(path)
+    if match:
+        return get_events, [urllib.parse.unquote(match.group(1))]
+    raise NotFound(f"Unknown path '{path}'.")
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+
+    server_version = "chat-history"
+
+    # The database only changes when chat-history is re-run, so responses are versioned by the state of the database
+    # file (and its write-ahead log, if any), allowing them to be revalidated without running any queries.
+    def database_version(self):
+        version = []
+        for path in [self.server.pool.path, self.server.pool.path + "-wal"]:
+            try:
+                stat = os.stat(path)
+                version.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                pass
+        return version
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        parameters = dict(urllib.parse.parse_qsl(url.query))
+        try:
+            version = self.database_version()
+            etag = '"' + hashlib.sha256(json.dumps([version, self.path]).encode()).hexdigest()[:32] + '"'
+            last_modified = max(mtime for mtime, _ in version) // 1000000000
+            headers = {"ETag": etag,
+                       "Last-Modified": email.utils.formatdate(last_modified, usegmt=True),
+                       "Cache-Control": "no-cache",
+                       "Access-Control-Allow-Origin": "*"}
+            handler, arguments = route(url.path)
+            with self.server.pool.connection() as connection:
+                response = handler(connection, parameters, *arguments)
+                if self.is_not_modified(etag, last_modified):
+                    self.respond(http.HTTPStatus.NOT_MODIFIED, headers)
+                    return
+                body = response()
+        except BadRequest as e:
+            self.respond(http.HTTPStatus.BAD_REQUEST, {}, {"error": str(e)})
+            return
+        except NotFound as e:
+            self.respond(http.HTTPStatus.NOT_FOUND, {}, {"error": str(e)})
+            return
+        except Exception:
+            logging.exception("Failed to handle request for '%s'.", self.path)
+            self.respond(http.HTTPStatus.INTERNAL_SERVER_ERROR, {}, {"error": "Internal server error."})
+            return
+        self.respond(http.HTTPStatus.OK, headers, body)
+
+    def is_not_modified(self, etag, last_modified):
+        if "If-None-Match" in self.headers:
+            return etag in [tag.strip() for tag in self.headers["If-None-Match"].split(",")]
+        if "If-Modified-Since" in self.headers:
+            try:
+                since = email.utils.parsedate_to_datetime(self.headers["If-Modified-Since"])
+            except (TypeError, ValueError):
+                return False
+            return last_modified <= since.timestamp()
+        return False
+
+    def respond(self, status, headers, body=None):
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        if body is not None:
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logging.debug(format, *args)
+
+
+class Server(http.server.ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, address, pool):
+        super().__init__(address, Handler)
+        self.pool = pool
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a read-only JSON API for the chat history database.")
+    parser.add_argument("--verbose", "-v", action="store_true", default=False, help="verbose logging")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (defaults to 127.0.0.1)")
+    parser.add_argument("--port", "-p", type=int, default=8000, help="port to listen on (defaults to 8000)")
+    parser.add_argument("--connections", type=int, default=4, help="number of database connections to pool")
+    parser.add_argument("database", nargs="?", default=DEFAULT_DATABASE_PATH, help="database path")
+    options = parser.parse_args()
+
+    with store.ConnectionPool(options.database, size=options.connections) as pool, \
+            Server((options.host, options.port), pool) as server:
+        logging.info("Serving '%s' at http://%s:%d/.", options.database, options.host, server.server_address[1])
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -22,20 +22,30 @@
 
 import argparse
 import collections
+import concurrent.futures
+import contextlib
 import functools
+import hashlib
+import heapq
 import importlib
+import io
+import itertools
+import json
 import logging
-import operator
 import os
+import pickle
 import shutil
 import sys
+import time
 
 import jinja2
 import yaml
 
-from PIL import Image as Img
-
+import cache
+import images
 import model
+import profiling
+import search_index
 import store
 import utilities
 
@@ -49,10 +59,23 @@ STATIC_DIRECTORY = os.path.join(ROOT_DIRECTORY, "static")
 TEMPLATES_DIRECTORY = os.path.join(ROOT_DIRECTORY, "templates")
 IMPORTERS_DIRECTORY = os.path.join(ROOT_DIRECTORY, "importers")
 
+CACHE_DIRECTORY = os.path.expanduser("~/.chat-history/cache")
+TEMPLATES_CACHE_DIRECTORY = os.path.join(CACHE_DIRECTORY, "templates")
+
 OUTPUT_DATA_DIRECTORY = os.path.expanduser("~/.chat-history/data")
 OUTPUT_ATTACHMENTS_DIRECTORY = os.path.join(OUTPUT_DATA_DIRECTORY, "attachments")
 OUTPUT_INDEX_PATH = os.path.join(OUTPUT_DATA_DIRECTORY, "index.html")
+OUTPUT_CONVERSATIONS_PATH = os.path.join(OUTPUT_DATA_DIRECTORY, "conversations.js")
 OUTPUT_DATABASE_PATH = os.path.join(OUTPUT_DATA_DIRECTORY, "messages.sqlite")
+OUTPUT_MANIFEST_PATH = os.path.join(OUTPUT_DATA_DIRECTORY, "manifest.json")
+OUTPUT_EXPORT_DIRECTORY = os.path.join(OUTPUT_DATA_DIRECTORY, "conversations")
+OUTPUT_SEARCH_DIRECTORY = os.path.join(OUTPUT_DATA_DIRECTORY, "search")
+
+# Increment whenever the rendered or exported output changes to invalidate previously rendered conversations.
+RENDER_VERSION = 2
+
+# Number of events in each chunk of an exported conversation.
+EXPORT_CHUNK_SIZE = 1000
 
 
 class Configuration(object):
@@ -83,18 +106,22 @@ def group_events(people, events):
 IMAGE_TYPES = [".jpg", ".gif", ".png", ".jpeg"]
 
 
-def detect_images(directory, events):
+def is_image(event):
+    if event.type != model.EventType.ATTACHMENT:
+        return False
+    _, ext = os.path.splitext(event.content)
+    return ext.lower() in IMAGE_TYPES
+
+
+def detect_images(sizes, events):
     for event in events:
-        if event.type == model.EventType.ATTACHMENT:
-            _, ext = os.path.splitext(event.content)
-            if ext.lower() in IMAGE_TYPES:
-                image = Img.open(os.path.join(directory, event.content))
-                yield model.Image(date=event.date,
-                                  person=event.person,
-                                  content=event.content,
-                                  size=image.size)
-            else:
-                yield event
+        if is_image(event):
+            image = model.Image(date=event.date,
+                                person=event.person,
+                                content=event.content,
+                                size=sizes[event.content])
+            image.identify(event.source, event.id)
+            yield image
         else:
             yield event
 
@@ -107,9 +134,11 @@ def detect_videos(events):
         if event.type == model.EventType.ATTACHMENT:
             _, ext = os.path.splitext(event.content)
             if ext.lower() in VIDEO_TYPES:
-                yield model.Video(date=event.date,
-                                  person=event.person,
-                                      content=event.content)
+                video = model.Video(date=event.date,
+                                    person=event.person,
+                                    content=event.content)
+                video.identify(event.source, event.id)
+                yield video
             else:
                 yield event
         else:
@@ -120,45 +149,308 @@ def hash_identifiers(objects):
     return ".".join(sorted([o.id for o in objects]))
 
 
+# Lazily merge lists of time-ordered events using a heap; events with equal timestamps are yielded in the order of the
+# lists they came from.
 def merge_events(events):
-    events_copy = [list(e) for e in events]
-    result = []
-    while True:
+    heap = []
+    for index, iterator in enumerate(iter(e) for e in events):
+        event = next(iterator, None)
+        if event is not None:
+            heap.append((event.date, index, event, iterator))
+    try:
+        heapq.heapify(heap)
+    except TypeError as e:
+        log_merge_failure(heap)
+        raise e
+    while heap:
+        _, index, event, iterator = heap[0]
+        yield event
+        event = next(iterator, None)
         try:
-            events_copy = sorted(events_copy, key=lambda x: x[0].date)
+            if event is None:
+                heapq.heappop(heap)
+            else:
+                heapq.heapreplace(heap, (event.date, index, event, iterator))
         except TypeError as e:
-            for events_list in events_copy:
-                logging.error(events_list[0])
+            log_merge_failure(heap)
             raise e
-        result.append(events_copy[0].pop(0))
-        events_copy = [e for e in events_copy if e]
-        if not events_copy:
-            break
-    return result
+
+
+def log_merge_failure(heap):
+    # Comparing naive and aware dates fails, so we log the head of each list to help track down the culprit.
+    for (_, _, event, _) in sorted(heap, key=lambda x: x[1]):
+        logging.error(event)
 
 
 def merge_sessions(sessions):
-    events = merge_events([session.events for session in sessions])
-    sources = functools.reduce(operator.concat, [session.sources for session in sessions], [])
+    events = list(merge_events([session.events for session in sessions]))
+    sources = list(itertools.chain.from_iterable(session.sources for session in sessions))
     session = model.Session(sources=sources,
-                            people=utilities.unique(functools.reduce(operator.concat,
-                                                                     [session.people for session in sessions],
-                                                                     [])),
+                            people=utilities.unique(itertools.chain.from_iterable(session.people for session in sessions)),
                             events=events)
     return session
 
 
+# The conversation list is written once as a script shared by every page, rather than being rendered into each page.
+def write_conversations(fh, conversations):
+    fh.write("const conversations = ")
+    json.dump([{"id": conversation.id,
+                "name": conversation.name,
+                "sources": conversation.sources,
+                "configuration": conversation.configuration}
+               for conversation in conversations], fh)
+    fh.write(";\n")
+
+
+# Templates are compiled once per process, with the compiled bytecode cached across runs.
+@functools.lru_cache(maxsize=None)
+def conversation_template():
+    os.makedirs(TEMPLATES_CACHE_DIRECTORY, exist_ok=True)
+    environment = jinja2.Environment(loader=jinja2.FileSystemLoader(TEMPLATES_DIRECTORY),
+                                     bytecode_cache=jinja2.FileSystemBytecodeCache(TEMPLATES_CACHE_DIRECTORY))
+    return environment.get_template("conversation.html")
+
+
+@functools.lru_cache(maxsize=None)
+def templates_digest():
+    digest = hashlib.sha256()
+    for path in sorted(utilities.glob(TEMPLATES_DIRECTORY, "*")):
+        digest.update(os.path.basename(path).encode() + b"\0")
+        with open(path, "rb") as fh:
+            digest.update(fh.read())
+    return digest.hexdigest()
+
+
+# Covers everything the conversation template and export read, along with the templates themselves.
+def conversation_fingerprint(conversation):
+    digest = hashlib.sha256(f"{RENDER_VERSION}\0{EXPORT_CHUNK_SIZE}\0{templates_digest()}\n".encode())
+    digest.update(f"{conversation.id}\0{conversation.name}\n".encode())
+    for person in conversation.people:
+        digest.update(f"{person.id}\0{person.name}\0{person.is_primary}\n".encode())
+    for batch in conversation.batches:
+        digest.update(f"{batch.person.name}\0{batch.person.is_primary}\n".encode())
+        for event in batch.events:
+            size = event.size if event.type == model.EventType.IMAGE else None
+            digest.update(f"{event.id}\0{event.type.value}\0{event.date.isoformat()}\0{event.content}\0{size}\n".encode())
+    return digest.hexdigest()
+
+
+# Records the fingerprint of each page rendered into the output directory, so that pages whose inputs haven't changed
+# since they were last rendered can be skipped (leaving the files, and their modification times, untouched).
+class RenderManifest(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.directory = os.path.dirname(path)
+        self.previous_fingerprints = {}
+        self.fingerprints = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path) as fh:
+                    self.previous_fingerprints = json.load(fh)
+            except (OSError, ValueError) as e:
+                logging.warning("Ignoring invalid render manifest (%s).", e)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+
+    # Returns true if `basename` (and any additional `outputs` that are generated with it) needs to be rendered.
+    def update(self, basename, fingerprint, outputs=()):
+        self.fingerprints[basename] = fingerprint
+        return (self.previous_fingerprints.get(basename) != fingerprint or
+                not all(os.path.exists(os.path.join(self.directory, path)) for path in [basename, *outputs]))
+
+    def close(self):
+        with open(self.path, "w") as fh:
+            json.dump(self.fingerprints, fh)
+
+
+def export_event(event):
+    result = {"id": event.id,
+              "type": event.type.value,
+              "date": event.date.isoformat(),
+              "person": event.person.id,
+              "content": event.content}
+    if event.type == model.EventType.IMAGE:
+        result["width"], result["height"] = event.size
+    if isinstance(event, model.Attachment):
+        result["mimetype"] = event.mimetype
+    return result
+
+
+def export_manifest_path(conversation):
+    return os.path.join(OUTPUT_EXPORT_DIRECTORY, conversation.id, "manifest.json")
+
+
+def export_terms_path(conversation):
+    return os.path.join(OUTPUT_EXPORT_DIRECTORY, conversation.id, "terms.json")
+
+
+# Writes the events of a conversation as JSON chunks of `EXPORT_CHUNK_SIZE` events, alongside a manifest listing the
+# time range and size of each chunk, allowing viewers to load only the events they need (and to locate a date by
+# binary searching the manifest). Chunks are counted from the oldest event, so that new events only change the newest
+# chunk; both the chunks in the manifest, and the events in each chunk, are listed newest first. The search postings for
+# the conversation are gathered as the events are exported, and written alongside the chunks to be merged into the
+# search index by `search_index.write_index`.
+def export_conversation(conversation):
+    directory = os.path.join(OUTPUT_EXPORT_DIRECTORY, conversation.id)
+    os.makedirs(directory, exist_ok=True)
+    events = [event for batch in conversation.batches for event in batch.events]
+    postings = search_index.Postings()
+    chunks = []
+    for index, start in enumerate(range(0, len(events), EXPORT_CHUNK_SIZE)):
+        chunk = events[start:start + EXPORT_CHUNK_SIZE]
+        basename = f"{index:05d}.json"
+        exported_events = []
+        for ordinal in reversed(range(start, start + len(chunk))):
+            event = events[ordinal]
+            exported_events.append(export_event(event))
+            if event.type.value in store.SEARCHABLE_TYPES:
+                postings.add(ordinal, utilities.html_to_text(event.content))
+        data = json.dumps(exported_events)
+        utilities.write_if_changed(os.path.join(directory, basename), data)
+        chunks.append({"path": basename,
+                       "count": len(chunk),
+                       "start": chunk[0].date.isoformat(),
+                       "end": chunk[-1].date.isoformat(),
+                       "size": len(data.encode())})
+    manifest = {"id": conversation.id,
+                "name": conversation.name,
+                "count": len(events),
+                "chunk_size": EXPORT_CHUNK_SIZE,
+                "people": {person.id: {"name": person.name, "primary": person.is_primary}
+                           for person in conversation.people},
+                "chunks": list(reversed(chunks))}
+    utilities.write_if_changed(export_manifest_path(conversation), json.dumps(manifest))
+    utilities.write_if_changed(export_terms_path(conversation), postings.json())
+    remove_stale_files(directory, "*.json", {"manifest.json", "terms.json"} | {chunk["path"] for chunk in chunks})
+
+
+def render_conversation(conversation):
+    path = os.path.join(OUTPUT_DATA_DIRECTORY, f"{conversation.id}.html")
+    conversation_template().stream(conversation=conversation, EventType=model.EventType).dump(path)
+    export_conversation(conversation)
+
+
+# Conversations are streamed directly to disk, and rendered in a process pool when running with more than one job.
+# Conversations that are unchanged according to `manifest` are skipped. Returns the number rendered and skipped.
+def render_conversations(conversations, jobs, manifest):
+    dirty = [conversation
+             for conversation in conversations
+             if manifest.update(f"{conversation.id}.html", conversation_fingerprint(conversation),
+                                outputs=[os.path.relpath(export_manifest_path(conversation), OUTPUT_DATA_DIRECTORY),
+                                         os.path.relpath(export_terms_path(conversation), OUTPUT_DATA_DIRECTORY)])]
+    if jobs == 1 or len(dirty) < 2:
+        for conversation in dirty:
+            render_conversation(conversation)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            chunksize = max(1, len(dirty) // (jobs * 4))
+            for _ in executor.map(render_conversation, dirty, chunksize=chunksize):
+                pass
+    return len(dirty), len(conversations) - len(dirty)
+
+
+# Returns the serialized sessions along with the time taken to import them.
+def import_detached(module, path):
+    start = time.perf_counter()
+    importer = importlib.import_module(module)
+    context = model.ImportContext(people=model.DetachedPeople())
+    sessions = importer.import_messages(context, OUTPUT_ATTACHMENTS_DIRECTORY, path)
+    return model.dump_sessions(sessions, context.people), time.perf_counter() - start
+
+
+# Yields the sessions for each (importer, path) task in order. Sources that aren't cached are imported in a process pool
+# when running with more than one job; workers return serialized sessions which refer to people by identifier, allowing
+# them to be reconciled with `people` in the parent process. The number of events imported from each source, and the
+# time taken to import them (excluding time spent waiting for workers), are recorded with `profiler`. Cached sessions
+# that can't be deserialized are discarded, and the source is imported again.
+def import_sources(tasks, people, import_cache, jobs, profiler):
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else contextlib.nullcontext() as executor:
+        results = []
+        for importer, path in tasks:
+            key, data = import_cache.lookup(importer, path) if import_cache is not None else (None, None)
+            is_cached = data is not None
+            if not is_cached and executor is not None:
+                data = executor.submit(import_detached, importer.__name__, path)
+            results.append((importer, path, key, is_cached, data))
+        for importer, path, key, is_cached, data in results:
+            context = model.ImportContext(people=people)
+            duration = 0.0
+            if isinstance(data, concurrent.futures.Future):
+                data, duration = data.result()
+            start = time.perf_counter()
+            if data is None:
+                logging.debug("Importing '%s'...", path)
+                if import_cache is None:
+                    sessions = importer.import_messages(context, OUTPUT_ATTACHMENTS_DIRECTORY, path)
+                else:
+                    data, _ = import_detached(importer.__name__, path)
+            if data is not None:
+                try:
+                    sessions = model.load_sessions(data, context)
+                except (EOFError, pickle.UnpicklingError) as e:
+                    if not is_cached:
+                        raise
+                    import_cache.discard(key, path, e)
+                    is_cached = False
+                    context = model.ImportContext(people=people)
+                    data, _ = import_detached(importer.__name__, path)
+                    sessions = model.load_sessions(data, context)
+                if import_cache is not None and not is_cached:
+                    import_cache.store(key, data, cache.attachments(sessions))
+            model.identify_events(path, itertools.chain.from_iterable(session.events for session in sessions))
+            duration += time.perf_counter() - start
+            profiler.source(importer=importer.__name__.rpartition(".")[2],
+                            path=path,
+                            events=sum(len(session.events) for session in sessions),
+                            duration=duration,
+                            is_cached=is_cached)
+            yield from sessions
+
+
+# The output directory is updated in place, so files (and directories) from previous runs are removed once they're no
+# longer referenced.
+def remove_stale_files(directory, pattern, basenames):
+    for path in utilities.glob(directory, pattern):
+        if os.path.basename(path) in basenames:
+            continue
+        logging.debug("Removing '%s'...", path)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+
 def main():
     parser = argparse.ArgumentParser(description="Parse chat logs and generate HTML.")
     parser.add_argument("--verbose", "-v", action="store_true", default=False, help="verbose logging")
+    parser.add_argument("--no-cache", action="store_true", default=False, help="re-import all sources, ignoring the import cache")
+    parser.add_argument("--jobs", "-j", type=int, default=1, help="number of processes used to import sources and render conversations (0 to use all cores)")
+    parser.add_argument("--profile", action="store_true", default=False, help="log the time, memory, and throughput of each stage (tracing memory allocations)")
+    parser.add_argument("--profile-directory", help="write cProfile statistics for each stage to this directory")
+    parser.add_argument("--stats-json", help="write the time, memory, and throughput of each stage to this file as JSON")
     parser.add_argument("configuration", help="configuration file")
     options = parser.parse_args()
 
+    profiler = profiling.Profiler(trace_memory=options.profile, profile_directory=options.profile_directory)
+    try:
+        run(options, profiler)
+    finally:
+        profiler.close()
+    if options.profile:
+        profiler.log()
+    if options.stats_json:
+        profiler.write(options.stats_json)
+
+
+def run(options, profiler):
     configuration = Configuration(options.configuration)
-    if os.path.exists(OUTPUT_DATA_DIRECTORY):
-        shutil.rmtree(OUTPUT_DATA_DIRECTORY)
-    os.makedirs(OUTPUT_DATA_DIRECTORY)
-    os.makedirs(OUTPUT_ATTACHMENTS_DIRECTORY)
+    os.makedirs(OUTPUT_ATTACHMENTS_DIRECTORY, exist_ok=True)
 
     # Load the importers.
     importers = {}
@@ -167,74 +459,120 @@ def main():
         name = os.path.basename(module)
         module = module.replace("/", ".")
         importlib.import_module(module)
-        importers[name] = sys.modules[module].import_messages
+        importers[name] = sys.modules[module]
 
     people = model.People()
     for person in configuration.configuration["people"]:
         p = model.Person(name=person["name"],
                          is_primary=person["primary"] if "primary" in person else False)
+        p.id = model.stable_id("person", "name", person["name"])
         for identity in person["identities"]:
             people.people[identity] = p
 
     # Run all the importers.
     logging.info("Importing messages...")
-    sessions = []
-    conversations = []
-    for source in configuration.configuration["sources"]:
-        context = model.ImportContext(people=people)
-        importer = importers[source["format"]]
-        paths = utilities.glob(".", source["path"])
-        if not paths:
-            logging.error("Unable to find anything to import for '%s'.", source["path"])
-            exit()
-        for path in paths:
-            logging.debug("Importing '%s'...", path)
-            for session in importer(context, OUTPUT_ATTACHMENTS_DIRECTORY, path):
-                events = detect_images(OUTPUT_ATTACHMENTS_DIRECTORY, session.events)
-                events = list(detect_videos(events))
-                sessions.append(model.Session(sources=session.sources, people=session.people, events=events))
-
-    # Merge conversations.
-    threads = collections.defaultdict(list)
-    for session in sessions:
-        threads[hash_identifiers(session.people)].append(session)
-    sessions = [merge_sessions(sessions) for sessions in threads.values()]
-
-    # Generate conversations.
-    for session in sessions:
-        batches = list(group_events(session.people, session.events))
-        conversation = model.Conversation(sources=session.sources, people=session.people, batches=batches)
-        conversations.append(conversation)
-
-    # Sort the conversations by name.
-    conversations = sorted(conversations, key=lambda x: x.name)
+    with profiler.stage("import") as stage:
+        tasks = []
+        conversations = []
+        for source in configuration.configuration["sources"]:
+            importer = importers[source["format"]]
+            paths = utilities.glob(".", source["path"])
+            if not paths:
+                logging.error("Unable to find anything to import for '%s'.", source["path"])
+                exit()
+            tasks.extend((importer, path) for path in paths)
+        import_cache = None if options.no_cache else cache.SessionCache(os.path.join(CACHE_DIRECTORY, "sessions"),
+                                                                        OUTPUT_ATTACHMENTS_DIRECTORY)
+        jobs = options.jobs or os.cpu_count()
+        with import_cache or contextlib.nullcontext():
+            imported_sessions = list(import_sources(tasks, people, import_cache, jobs, profiler))
+        stage.count(sources=len(tasks),
+                    sessions=len(imported_sessions),
+                    events=sum(len(session.events) for session in imported_sessions))
+
+    # Determine the image sizes.
+    logging.info("Detecting images...")
+    with profiler.stage("detect_images") as stage:
+        image_cache = images.SizeCache(None if options.no_cache else os.path.join(CACHE_DIRECTORY, "images.json"))
+        with image_cache:
+            sizes = image_cache.lookup(OUTPUT_ATTACHMENTS_DIRECTORY,
+                                       {event.content
+                                        for session in imported_sessions
+                                        for event in session.events
+                                        if is_image(event)})
+        sessions = []
+        for session in imported_sessions:
+            events = detect_images(sizes, session.events)
+            events = list(detect_videos(events))
+            sessions.append(model.Session(sources=session.sources, people=session.people, events=events))
+        stage.count(images=len(sizes))
+
+    with profiler.stage("merge") as stage:
+
+        # Merge conversations.
+        threads = collections.defaultdict(list)
+        for session in sessions:
+            threads[hash_identifiers(session.people)].append(session)
+        sessions = [merge_sessions(sessions) for sessions in threads.values()]
+
+        # Generate conversations.
+        for session in sessions:
+            batches = list(group_events(session.people, session.events))
+            conversation = model.Conversation(sources=session.sources, people=session.people, batches=batches)
+            conversations.append(conversation)
+
+        # Sort the conversations by name.
+        conversations = sorted(conversations, key=lambda x: x.name)
+        stage.count(conversations=len(conversations),
+                    batches=sum(len(conversation.batches) for conversation in conversations))
 
     # Copy the static application files.
-    shutil.copytree(STATIC_DIRECTORY, os.path.join(OUTPUT_DATA_DIRECTORY, "static"))
+    shutil.copytree(STATIC_DIRECTORY, os.path.join(OUTPUT_DATA_DIRECTORY, "static"), dirs_exist_ok=True)
 
     # Render the templates.
     logging.info("Rendering conversations...")
-    environment = jinja2.Environment(loader=jinja2.FileSystemLoader(TEMPLATES_DIRECTORY))
-    with utilities.chdir(OUTPUT_DATA_DIRECTORY):
-        conversation_template = environment.get_template("conversation.html")
-        index_template = environment.get_template("index.html")
-        with open(OUTPUT_INDEX_PATH, "w") as fh:
-            fh.write(conversation_template.render(conversations=conversations, EventType=model.EventType))
-        for conversation in conversations:
-            with open(f"{conversation.id}.html", "w") as fh:
-                fh.write(conversation_template.render(conversations=conversations, conversation=conversation, EventType=model.EventType))
-
-    # Write the messages to the database.
+    with RenderManifest(OUTPUT_MANIFEST_PATH) as manifest:
+        with profiler.stage("render") as stage:
+            with io.StringIO() as fh:
+                write_conversations(fh, conversations)
+                utilities.write_if_changed(OUTPUT_CONVERSATIONS_PATH, fh.getvalue())
+            if manifest.update(os.path.basename(OUTPUT_INDEX_PATH), templates_digest()):
+                conversation_template().stream(EventType=model.EventType).dump(OUTPUT_INDEX_PATH)
+            rendered, skipped = render_conversations(conversations, jobs, manifest)
+            logging.info("Rendered %d conversations (%d unchanged).", rendered, skipped)
+            stage.count(rendered=rendered, skipped=skipped)
+
+        # Merge the search postings written while rendering into the search index.
+        with profiler.stage("search_index") as stage:
+            fingerprint = hashlib.sha256("".join(manifest.fingerprints[f"{conversation.id}.html"]
+                                                 for conversation in conversations).encode()).hexdigest()
+            if manifest.update(os.path.join(os.path.basename(OUTPUT_SEARCH_DIRECTORY), search_index.MANIFEST_FILENAME),
+                               fingerprint):
+                shards = search_index.write_index(OUTPUT_SEARCH_DIRECTORY,
+                                                  [(conversation.id, export_terms_path(conversation))
+                                                   for conversation in conversations])
+                logging.info("Wrote search index (%d shards).", shards)
+                stage.count(shards=shards)
+
+    # Write the messages to the database, only bulk loading when it's empty.
     logging.info("Writing messages to database...")
-    with store.Store(OUTPUT_DATABASE_PATH) as database:
-        with database.transaction() as transaction:
-            for person in set(people.people.values()):
-                transaction.add_person(person)
-            for conversation in conversations:
-                transaction.add_conversation(conversation)
-                for batch in conversation.batches:
-                    for event in batch.events:
-                        transaction.add_event(event, conversation)
+    with profiler.stage("store") as stage:
+        with store.Store(OUTPUT_DATABASE_PATH) as database:
+            with database.bulk_load() if database.is_empty() else contextlib.nullcontext(), \
+                    database.transaction() as transaction:
+                summary = transaction.update(set(people.people.values()), conversations)
+        stage.count(sources=summary.sources, changed=summary.changed, written=summary.written, removed=summary.removed)
+
+    # Remove the output of previous runs that is no longer referenced.
+    remove_stale_files(OUTPUT_DATA_DIRECTORY, "*.html",
+                       {os.path.basename(OUTPUT_INDEX_PATH)} | {f"{conversation.id}.html" for conversation in conversations})
+    remove_stale_files(OUTPUT_EXPORT_DIRECTORY, "*", {conversation.id for conversation in conversations})
+    remove_stale_files(OUTPUT_ATTACHMENTS_DIRECTORY, "*",
+                       {event.content
+                        for conversation in conversations
+                        for batch in conversation.batches
+                        for event in batch.events
+                        if isinstance(event, model.Attachment)})
 
     logging.info("Chat history written to '%s'.", OUTPUT_INDEX_PATH)
 
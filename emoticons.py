@@ -81,10 +81,23 @@ EMOTICONS = {
     "(S)": "🌘",
 }
 
-EMOTICON_EXPRESSIONS = {re.compile(re.escape(string), re.IGNORECASE): emoji for (string, emoji) in EMOTICONS.items()}
+# Emoticons in the order in which they're matched, preferring the longest match.
+EMOTICON_STRINGS = sorted(EMOTICONS.keys(), key=len, reverse=True)
+
+# Single case-insensitive expression matching all emoticons, with one group per emoticon. Emoji are looked up by the
+# group that matched rather than the matched text, since case-insensitive matching also accepts Unicode variants whose
+# lowercase form differs from the emoticon's (e.g., ':ſ' and '(İ)').
+EMOTICON_EXPRESSION = re.compile("|".join(f"({re.escape(string)})" for string in EMOTICON_STRINGS), re.IGNORECASE)
+
+# Every emoticon begins with one of these characters, allowing us to skip text which can't contain any emoticons.
+TRIGGER_CHARACTERS = {string[0] for string in EMOTICONS.keys()}
+
+
+def replace(match):
+    return EMOTICONS[EMOTICON_STRINGS[match.lastindex - 1]]
 
 
 def detect(text):
-    for expression, emoji in EMOTICON_EXPRESSIONS.items():
-        text = expression.sub(emoji, text)
-    return text
+    if not any(character in text for character in TRIGGER_CHARACTERS):
+        return text
+    return EMOTICON_EXPRESSION.sub(replace, text)
@@ -0,0 +1,120 @@
+# Copyright (c) 2021-2024 Jason Morley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import concurrent.futures
+import json
+import logging
+import os
+import struct
+
+from PIL import Image as Img
+
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+GIF_SIGNATURES = [b"GIF87a", b"GIF89a"]
+JPEG_SIGNATURE = b"\xff\xd8"
+
+# JPEG start-of-frame markers (excluding DHT, JPG and DAC which share the range).
+JPEG_SOF_MARKERS = set(range(0xc0, 0xd0)) - {0xc4, 0xc8, 0xcc}
+
+# JPEG markers without a length field.
+JPEG_STANDALONE_MARKERS = set(range(0xd0, 0xda)) | {0x01}
+
+
+def jpeg_size(fh):
+    fh.seek(2)
+    while True:
+        byte = fh.read(1)
+        while byte == b"\xff":
+            byte = fh.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+        if marker in JPEG_STANDALONE_MARKERS:
+            continue
+        length, = struct.unpack(">H", fh.read(2))
+        if marker in JPEG_SOF_MARKERS:
+            _, height, width = struct.unpack(">BHH", fh.read(5))
+            return (width, height)
+        fh.seek(length - 2, os.SEEK_CUR)
+
+
+# Reads the dimensions of PNG, GIF and JPEG images from their headers, returning None for unsupported formats.
+def header_size(fh):
+    header = fh.read(24)
+    if header.startswith(PNG_SIGNATURE) and header[12:16] == b"IHDR":
+        return struct.unpack(">II", header[16:24])
+    elif header[:6] in GIF_SIGNATURES:
+        return struct.unpack("<HH", header[6:10])
+    elif header.startswith(JPEG_SIGNATURE):
+        return jpeg_size(fh)
+    return None
+
+
+def size(path):
+    try:
+        with open(path, "rb") as fh:
+            result = header_size(fh)
+        if result is not None:
+            return tuple(result)
+    except struct.error:
+        pass
+    logging.debug("Using Pillow to determine the size of '%s'...", path)
+    with Img.open(path) as image:
+        return image.size
+
+
+# Persistent cache of image sizes. Attachments are content-addressed, so their basenames identify their contents.
+class SizeCache(object):
+
+    def __init__(self, path=None):
+        self.path = path
+        self.sizes = {}
+        self.used_sizes = {}
+        if self.path is not None and os.path.exists(self.path):
+            try:
+                with open(self.path) as fh:
+                    self.sizes = {basename: tuple(size) for basename, size in json.load(fh).items()}
+            except (OSError, ValueError) as e:
+                logging.warning("Ignoring invalid image cache (%s).", e)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+
+    def lookup(self, directory, basenames, jobs=None):
+        missing = [basename for basename in basenames if basename not in self.sizes]
+        logging.debug("Probing %d images (%d cached)...", len(missing), len(basenames) - len(missing))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+            paths = [os.path.join(directory, basename) for basename in missing]
+            self.sizes.update(zip(missing, executor.map(size, paths)))
+        result = {basename: self.sizes[basename] for basename in basenames}
+        self.used_sizes.update(result)
+        return result
+
+    def close(self):
+        if self.path is None:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "w") as fh:
+            json.dump(self.used_sizes, fh)
@@ -19,5 +19,9 @@
 # SOFTWARE.
 
 
+# Increment whenever the importer's output changes to invalidate cached sessions.
+VERSION = 1
+
+
 def import_messages(context, media_destination_path, path):
     return []
@@ -20,7 +20,6 @@
 
 import logging
 import os
-import re
 
 import lxml.etree
 
@@ -29,31 +28,61 @@ import utilities
 import model
 
 
+# Increment whenever the importer's output changes to invalidate cached sessions.
+VERSION = 4
+
+DATE_PARSER = utilities.ISODateParser()
+
+TEXT = lxml.etree.XPath("Text/text()")
+
+
+def parse_message(context, message):
+    date = message.get("DateTime")
+    user = message.find("From/User")
+    text = TEXT(message)
+    if date is None or user is None or not text:
+        raise ValueError("Incomplete message.")
+    identity = user.get("LogonName") or user.get("FriendlyName")
+    if not identity:
+        raise ValueError("Missing sender.")
+    return model.Message(type=model.EventType.MESSAGE,
+                         date=DATE_PARSER.parse(date),
+                         person=context.person(identifier=str(identity)),
+                         content=utilities.text_to_html(emoticons.detect(str(text[0]))))
+
+
+# Streams the log one top-level `Message` element at a time, discarding each element (and its predecessors) once it
+# has been processed to keep memory flat. Truncated or otherwise malformed XML is recovered from where possible,
+# keeping every message that could be read.
+def read_messages(context, path):
+    log = lxml.etree.iterparse(path, events=("end",), tag="Message", recover=True)
+    try:
+        for _, message in log:
+            parent = message.getparent()
+            if parent is None or parent.getparent() is not None:
+                continue
+            try:
+                yield parse_message(context, message)
+            except ValueError as e:
+                logging.warning("Skipping malformed message in '%s' (%s).", path, e)
+            message.clear(keep_tail=True)
+            while message.getprevious() is not None:
+                del parent[0]
+    except lxml.etree.XMLSyntaxError as e:
+        logging.error("Failed to parse XML in '%s' (%s).", path, e)
+        return
+    if log.error_log:
+        logging.warning("Recovered from malformed XML in '%s' (%s).", path, log.error_log.last_error)
+
+
 def import_messages(context, media_destination_path, path):
     basename, _ = os.path.splitext(os.path.basename(path))
     default_person = context.person(identifier=basename)
 
     sessions = []
-    with open(path) as fh:
-        try:
-            log = lxml.etree.fromstring(fh.read())
-        except lxml.etree.XMLSyntaxError:
-            logging.error("Failed to parse XML")
-            return []
-        events = []
-        for message in log.xpath('Message'):
-            # lxml.etree.dump(message)
-            date = utilities.parse_date(message.xpath('@DateTime')[0])
-            text = message.xpath('Text/text()')[0]
-            identities = [message.xpath('From/User/@LogonName')[0],
-                          message.xpath('From/User/@FriendlyName')[0]]
-            identity = str(next(s for s in identities if s))
-            events.append(model.Message(type=model.EventType.MESSAGE,
-                                        date=date,
-                                        person=context.person(identifier=identity),
-                                        content=utilities.text_to_html(emoticons.detect(text))))
-        if events:
-            sessions.append(model.Session(sources=[path],
-                                          people=utilities.unique([event.person for event in events] + [context.people.primary] + [default_person]),
-                                          events=events))
+    events = list(read_messages(context, path))
+    if events:
+        sessions.append(model.Session(sources=[path],
+                                      people=utilities.unique([event.person for event in events] + [context.people.primary] + [default_person]),
+                                      events=events))
     return sessions
@@ -26,6 +26,10 @@ import model
 import utilities
 
 
+# Increment whenever the importer's output changes to invalidate cached sessions.
+VERSION = 2
+
+
 def import_messages(context, media_destination_path, path):
     sessions = []
     for identifier in os.listdir(path):
@@ -18,67 +18,62 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import codecs
 import logging
-import os
-
-import pyparsing as pp
-
-from pyparsing import Combine, Group, Keyword, LineEnd, OneOrMore, Suppress, Word, ZeroOrMore
+import re
 
 import emoticons
 import model
 import utilities
 
 
-class Characters(object):
+# Increment whenever the importer's output changes to invalidate cached sessions.
+VERSION = 4
 
-    def __init__(self, string):
-        self.string = string
+DATE_PARSER = utilities.DateParser(date_formats=["%d %B %Y"], separator=" ")
 
-    def __str__(self):
-        return self.string
+ENCODINGS = ['utf-8', 'utf-16', 'iso-8859-1']
 
-    def __iter__(self):
-        return self.string.__iter__()
+SEPARATOR = ".--------------------------------------------------------------------."
+SESSION_START_EXPRESSION = re.compile(r"^\s*\|\s*Session Start\s*:\s*(\d+\s+\w+\s+\d+)\s*\|\s*$")
+PARTICIPANTS_EXPRESSION = re.compile(r"^\s*\|\s*Participants\s*:\s*\|\s*$")
+PARTICIPANT_EXPRESSION = re.compile(r"^\s*\|\s*([^(]+)\(([^)\s]+)\)\s*\|\s*$")
+MESSAGE_EXPRESSION = re.compile(r"^\s*\[(\d+:\d+:\d+)\]\s*(.*)$")
+CONTINUATION_EXPRESSION = re.compile(r"^ {8,}(\S.*)$")
 
-    def __len__(self):
-        return self.string.__len__()
+UNDELIVERED_MESSAGE = "The following message could not be delivered to all recipients"
 
-    def __getitem__(self, index):
-        return self.string.__getitem__(index)
 
-    def __add__(self, obj):
-        if isinstance(obj, str):
-            return Characters(self.string + obj)
-        elif isinstance(obj, Characters):
-            return Characters(self.string + obj.string)
-        else:
-            raise AssertionError("Unsupported type.")
+class ParseError(Exception):
+    pass
 
-    def __sub__(self, obj):
-        if isinstance(obj, str):
-            return Characters("".join(set(self.string) - set(obj)))
-        elif isinstance(obj, Characters):
-            return Characters("".join(set(self.string) - set(obj.string)))
-        else:
-            raise AssertionError("Unsupported type.")
+
+def detect_encoding(path):
+    for encoding in ENCODINGS:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            with open(path, "rb") as fh:
+                for chunk in iter(lambda: fh.read(utilities.COPY_BUFFER_SIZE), b""):
+                    decoder.decode(chunk)
+                decoder.decode(b"", final=True)
+            return encoding
+        except UnicodeDecodeError:
+            pass
+    raise AssertionError("Unable to determine the encoding")
 
 
 def read(path):
-    with open(path, "rb") as fh:
-        content = fh.read()
-        for encoding in ['utf-8', 'utf-16', 'iso-8859-1']:
-            try:
-                return content.decode(encoding)
-            except UnicodeDecodeError:
-                pass
-    raise AssertionError("Unable to determine the encoding")
+    with open(path, "r", encoding=detect_encoding(path), newline="") as fh:
+        for line in fh:
+            yield line.rstrip("\r\n").expandtabs()
 
 
 def is_partial(participant):
     return participant.startswith("...")
 
 
+# Resolves the (often truncated) usernames shown against messages to participant emails. Prefix indexes are built once
+# per session so that each lookup is a handful of dictionary probes, and resolved lookups are memoised.
 class ParticipantMap(object):
 
     def __init__(self, participants):
@@ -86,94 +81,172 @@ class ParticipantMap(object):
         for participant in participants:
             self.participants[participant["name"].strip()] = participant["email"]
 
+        # Every prefix of every participant name, mapped to the first participant (in order) with that prefix.
+        self.prefixes = {}
+        for participant, email in self.participants.items():
+            for index in range(len(participant) + 1):
+                self.prefixes.setdefault(participant[:index], email)
+
+        # Every prefix of partial participant names, sans their leading ellipsis.
+        self.partial_prefixes = {}
+        self.partial_length = 0
+        for participant, email in self.participants.items():
+            if not is_partial(participant):
+                continue
+            partial = participant[3:]
+            self.partial_length = max(self.partial_length, len(partial))
+            for index in range(len(partial) + 1):
+                self.partial_prefixes.setdefault(partial[:index], email)
+
+        self.cache = {}
+
     def lookup(self, user):
+        try:
+            email = self.cache[user]
+        except KeyError:
+            email = self.resolve(user)
+            self.cache[user] = email
+        if email is None:
+            raise KeyError(user)
+        return email
+
+    def resolve(self, user):
         try:
             return self.participants[user]
-        except KeyError as e:
-
-            # Some users are truncated with an ellipsis.
-            if user.endswith(".."):
-                user = user[:-2]
-
-            # Before we do anything too clever, we see if any of the participants have
-            # names that begin with the partial user.
-            for participant in self.participants.keys():
-                if participant.startswith(user):
-                    return self.participants[participant]
-
-            # Assuming that failed, we need to do the same, slowly trimming down the user and
-            # only matching against known partial participants.
-            while user:
-                user = user[1:]
-                for participant in [participant for participant in self.participants.keys() if participant.startswith("...")]:
-                    if participant[3:].startswith(user):
-                        return self.participants[participant]
-
-            raise e
-
-
+        except KeyError:
+            pass
 
-def import_messages(context, media_destination_path, path):
-
-    content = read(path)
-    # content = utilities.remove_control_characters(content)
-
-    LINE_END = Suppress(LineEnd())
-    PIPE = Suppress("|")
-
-    TIME = Combine(Word(pp.nums) + ":" + Word(pp.nums) + ":" + Word(pp.nums))
-    USERNAME = Combine(OneOrMore(Word(pp.alphas.replace(":", "") + ".") | pp.White()))
-    INDENTATION = pp.White(' ', min=8).setParseAction(pp.replaceWith(" "))
-    SENTENCE = Combine(OneOrMore(Word(pp.printables) | " " | "\t"))
-    CONTENT = Combine(SENTENCE +
-                      Suppress(Word("\r\n")) +
-                      ZeroOrMore(INDENTATION + SENTENCE + Suppress(Word("\r\n"))))
-    MESSAGE = Group(Suppress("[") + TIME.setResultsName("time") + Suppress("]") +
-                    USERNAME.setResultsName("user") + Suppress(":") +
-                    CONTENT.setResultsName("content"))
-
-    HEADER_SEPARATOR = Suppress(Keyword(".--------------------------------------------------------------------.") + LINE_END)
-
-    SESSION_DATE = Combine(Word(pp.nums) + pp.White(" ") + Word(pp.alphas) + pp.White(" ") + Word(pp.nums))
-    SESSION_START = (PIPE +
-                     Suppress(Keyword("Session Start")) + Suppress(":") + SESSION_DATE.setResultsName("start") +
-                     PIPE +
-                     LINE_END)
-
-    PARTICIPANT_NAME = Word(Characters(pp.printables) + " " - "(")
-    PARTICIPANT_EMAIL = Word(pp.printables.replace(")", ""))
-    PARTICIPANT_LINE = Group(PIPE +
-                             PARTICIPANT_NAME.setResultsName("name") +
-                             Suppress("(") + PARTICIPANT_EMAIL.setResultsName("email") + Suppress(")") +
-                             PIPE +
-                             LINE_END)
-    PARTICIPANTS = PIPE + Suppress(Keyword("Participants")) + Suppress(":") + PIPE + LINE_END + OneOrMore(PARTICIPANT_LINE)
+        # Some users are truncated with an ellipsis.
+        if user.endswith(".."):
+            user = user[:-2]
 
-    HEADER = (HEADER_SEPARATOR +
-              SESSION_START +
-              PARTICIPANTS.setResultsName("participants") +
-              HEADER_SEPARATOR)
+        # Before we do anything too clever, we see if any of the participants have
+        # names that begin with the partial user.
+        try:
+            return self.prefixes[user]
+        except KeyError:
+            pass
+
+        # Assuming that failed, we look for the longest suffix of the user that begins a known partial participant;
+        # suffixes longer than the longest partial participant can never match.
+        if self.partial_prefixes:
+            for index in range(max(1, len(user) - self.partial_length), len(user) + 1):
+                try:
+                    return self.partial_prefixes[user[index:]]
+                except KeyError:
+                    pass
 
-    SESSION = Group((HEADER +
-                    Group(OneOrMore(MESSAGE)).setResultsName("messages")))
+        return None
 
-    parser = OneOrMore(SESSION)
 
-    try:
-        results = []
-        sessions = parser.parseString(content)
+class Session(object):
 
-        for session in sessions:
-            # print(session["start"])
+    def __init__(self, start):
+        self.start = start
+        self.participants = []
+        self.messages = []
 
-            participant_map = ParticipantMap(participants=session["participants"])
 
+# Splits an archive into sessions, line by line. Each session begins with a header listing the session start date and
+# participants, delimited by separators, followed by messages of the form '[HH:MM:SS] User: Content'; long messages
+# continue on lines indented by at least eight spaces. Yields either a `Session`, or a `ParseError` if the session is
+# malformed, in which case lines are skipped until the start of the next session.
+def parse_sessions(lines):
+    session = None
+    state = "start"
+    message = None
+    lines = iter(lines)
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            if line.strip() == SEPARATOR:
+                if state == "participants":
+                    state = "messages"
+                elif state == "messages":
+                    if message is not None:
+                        session.messages.append(message)
+                        message = None
+                    yield session
+                    state = "header"
+                elif state == "recovering":
+                    state = "recovering header"
+                else:
+                    state = "header"
+                continue
+
+            if state == "start":
+                raise ParseError(f"Unexpected line before session header '{line}'.")
+            elif state in ["header", "recovering header"]:
+                match = SESSION_START_EXPRESSION.match(line)
+                if not match:
+                    if state == "recovering header":
+                        state = "recovering"
+                        continue
+                    raise ParseError(f"Expected session start but found '{line}'.")
+                session = Session(start=match.group(1))
+                state = "participants header"
+            elif state == "participants header":
+                if not PARTICIPANTS_EXPRESSION.match(line):
+                    raise ParseError(f"Expected participants but found '{line}'.")
+                state = "participants"
+            elif state == "participants":
+                match = PARTICIPANT_EXPRESSION.match(line)
+                if not match:
+                    raise ParseError(f"Expected participant but found '{line}'.")
+                session.participants.append({"name": match.group(1), "email": match.group(2)})
+            elif state == "messages":
+                match = MESSAGE_EXPRESSION.match(line)
+                if match:
+                    if message is not None:
+                        session.messages.append(message)
+                    time, remainder = match.groups()
+
+                    # Usernames can span multiple lines (e.g., undelivered message notices), but never onto a line that
+                    # starts a new message.
+                    user = ""
+                    while ":" not in remainder:
+                        user = user + remainder + "\n"
+                        remainder = next(lines, None)
+                        if (remainder is None or
+                                remainder.strip() == SEPARATOR or
+                                MESSAGE_EXPRESSION.match(remainder)):
+                            raise ParseError(f"Unterminated username '{user}'.")
+                    username, _, content = remainder.partition(":")
+                    message = {"time": time, "user": user + username, "content": content.lstrip()}
+                    continue
+                match = CONTINUATION_EXPRESSION.match(line)
+                if not match or message is None:
+                    raise ParseError(f"Unexpected line '{line}'.")
+                message["content"] += " " + match.group(1)
+
+        except ParseError as e:
+            yield e
+            session = None
+            message = None
+            state = "recovering"
+
+    if state == "messages":
+        if message is not None:
+            session.messages.append(message)
+        yield session
+    elif state not in ["start", "recovering", "recovering header"]:
+        yield ParseError("Unexpected end of file.")
+
+
+def read_sessions(context, path):
+    for session in parse_sessions(read(path)):
+        if isinstance(session, ParseError):
+            logging.warning("Skipping malformed session in '%s' (%s).", path, session)
+            continue
+        try:
+            participant_map = ParticipantMap(participants=session.participants)
             events = []
-            for message in session["messages"]:
-                date = utilities.parse_date(session["start"] + " " + message["time"])
+            for message in session.messages:
+                date = DATE_PARSER.parse(session.start + " " + message["time"])
                 user = message["user"]
 
-                if user == 'The following message could not be delivered to all\r\n           recipients':
+                if " ".join(user.split()) == UNDELIVERED_MESSAGE:
                     continue
 
                 identifier = user
@@ -186,12 +259,14 @@ def import_messages(context, media_destination_path, path):
                                             date=date,
                                             person=context.person(identifier=identifier),
                                             content=utilities.text_to_html(emoticons.detect(message["content"]))))
-            if events:
-                results.append(model.Session(sources=[path],
-                                             people=utilities.unique([event.person for event in events] + [context.people.primary]),
-                                             events=events))
+        except ValueError as e:
+            logging.warning("Skipping malformed session in '%s' (%s).", path, e)
+            continue
+        if events:
+            yield model.Session(sources=[path],
+                                people=utilities.unique([event.person for event in events] + [context.people.primary]),
+                                events=events)
 
-    except pp.ParseException:
-        logging.warning("Unable to parse '%s'.", path)
 
-    return results
+def import_messages(context, media_destination_path, path):
+    return list(read_sessions(context, path))
@@ -18,13 +18,21 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import io
 import os
 import re
+import zipfile
 
 import model
 import utilities
 
 
+# Increment whenever the importer's output changes to invalidate cached sessions.
+VERSION = 4
+
+
+DATE_PARSER = utilities.DateParser(date_formats=["%d/%m/%Y", "%d/%m/%y"], separator=", ")
+
 ENCRYPTION_ANNOUNCEMENT = "Messages and calls are end-to-end encrypted. No one outside of this chat, not even WhatsApp, can read or listen to them."
 
 
@@ -64,15 +72,15 @@ def parse_structure(lines):
 
 def parse_messages(context, directory, lines):
     for (date, username, content) in parse_structure(lines):
-        e = event(directory=directory, date=utilities.parse_date(date), person=context.person(identifier=username), content=content)
+        e = event(directory=directory, date=DATE_PARSER.parse(date), person=context.person(identifier=username), content=content)
         if e is not None:
             yield e
 
 
 def import_messages(context, media_destination_path, path):
-    with utilities.unzip(path) as archive_path:
-        chats = os.path.join(archive_path, "_chat.txt")
-        with open(chats) as fh:
-            events = parse_messages(context=context, directory=archive_path, lines=list(fh.readlines()))
-            events = list(utilities.copy_attachments(media_destination_path, events))
+    with zipfile.ZipFile(path, 'r') as archive:
+        with archive.open("_chat.txt") as fh:
+            lines = io.TextIOWrapper(fh, encoding="utf-8")
+            events = parse_messages(context=context, directory="", lines=lines)
+            events = list(utilities.copy_attachments(media_destination_path, events, archive=archive))
     return [model.Session(sources=[path], people=utilities.unique([event.person for event in events] + [context.people.primary]), events=events)]
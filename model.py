@@ -18,11 +18,15 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import base64
 import collections
 import datetime
 import enum
+import functools
+import io
 import json
 import mimetypes
+import pickle
 import re
 import uuid
 
@@ -31,7 +35,15 @@ import yaml
 
 
 Batch = collections.namedtuple('Batch', ['date', 'person', 'events'])
-Emoji = collections.namedtuple('Emoji', ['type', 'date', 'person', 'content'])
+
+
+# Namespace for the deterministic (name-based) identifiers of people, conversations, and events, which allow successive
+# runs to be compared with each other.
+NAMESPACE = uuid.UUID("7cacac05-7f88-42e0-a3d3-4cf8a9df2041")
+
+
+def stable_id(*components):
+    return str(uuid.uuid5(NAMESPACE, "\0".join(components)))
 
 
 class ImportContext(object):
@@ -51,6 +63,7 @@ class People(object):
     def person(self, identifier):
         if identifier not in self.people:
             person = Person(name=identifier, is_primary=False)
+            person.id = stable_id("person", "identifier", identifier)
             self.people[identifier] = person
         return self.people[identifier]
 
@@ -63,6 +76,67 @@ class People(object):
         raise AssertionError("No primary person.")
 
 
+# Hands out a placeholder person for each identifier, allowing importer output to be serialized independently of the
+# people configuration and reconciled with a shared `People` instance by `load_sessions`.
+class DetachedPeople(People):
+
+    def __init__(self):
+        super().__init__()
+        self._primary = Person(name="", is_primary=True)
+
+    @property
+    def primary(self):
+        return self._primary
+
+
+class SessionPickler(pickle.Pickler):
+
+    PRIMARY = "primary"
+    IDENTIFIER = "identifier"
+
+    def __init__(self, file, people):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.primary = people.primary
+        self.identifiers = {person.id: identifier for identifier, person in people.people.items()}
+
+    def persistent_id(self, obj):
+        if not isinstance(obj, Person):
+            return None
+        if obj is self.primary:
+            return (self.PRIMARY, None)
+        return (self.IDENTIFIER, self.identifiers[obj.id])
+
+
+class SessionUnpickler(pickle.Unpickler):
+
+    def __init__(self, file, context):
+        super().__init__(file)
+        self.context = context
+
+    def persistent_load(self, pid):
+        kind, identifier = pid
+        if kind == SessionPickler.PRIMARY:
+            return self.context.people.primary
+        elif kind == SessionPickler.IDENTIFIER:
+            return self.context.person(identifier=identifier)
+        raise pickle.UnpicklingError(f"Unsupported persistent id '{kind}'.")
+
+
+def dump_sessions(sessions, people):
+    with io.BytesIO() as fh:
+        SessionPickler(fh, people).dump(sessions)
+        return fh.getvalue()
+
+
+def load_sessions(data, context):
+    with io.BytesIO(data) as fh:
+        sessions = SessionUnpickler(fh, context).load()
+    # Distinct placeholders may resolve to the same person (e.g., an identity of the primary person).
+    for session in sessions:
+        session.people = utilities.unique(session.people)
+    return sessions
+
+
 class EventType(enum.Enum):
     MESSAGE = "message"
     EMOJI = "emoji"
@@ -71,14 +145,31 @@ class EventType(enum.Enum):
     VIDEO = "video"
 
 
+# Objects are numerous (one per event), so they use `__slots__` and only generate their identifier on first use.
 class Object(object):
 
-    def __init__(self):
-        self.id = str(uuid.uuid4())
+    __slots__ = ("_id",)
+
+    @property
+    def id(self):
+        try:
+            return self._id
+        except AttributeError:
+            self._id = self.create_id()
+            return self._id
+
+    @id.setter
+    def id(self, value):
+        self._id = value
+
+    def create_id(self):
+        return str(uuid.uuid4())
 
 
 class Person(Object):
 
+    __slots__ = ("name", "is_primary")
+
     def __init__(self, name, is_primary):
         super().__init__()
         self.name = name
@@ -105,25 +196,36 @@ class Conversation(Object):
         self.people = people
         self.batches = batches
 
+    # Conversations are identified by their participants, who are identified by name or import identifier.
+    def create_id(self):
+        return stable_id("conversation", *sorted(person.id for person in self.people))
+
     # TODO: Ultimately we should use the person instead to get the configuration.
-    @property
+    @functools.cached_property
     def configuration(self):
         return yaml.dump([{"name": self.name,
                            "identities": [person.name for person in self.people if not person.is_primary]}],
                          sort_keys=False)
 
-    @property
+    @functools.cached_property
     def name(self):
         people = sorted(self.people, key=lambda x: x.name)
         return ", ".join([person.name for person in people if not person.is_primary])
 
 
-class Event(object):
+class Event(Object):
+
+    __slots__ = ("date", "person", "source")
 
     def __init__(self, date, person):
-        self.id = str(uuid.uuid4())
+        super().__init__()
         self.date = date
         self.person = person
+        self.source = None
+
+    def identify(self, source, id):
+        self.source = source
+        self.id = id
 
     def json(self):
         return json.dumps({
@@ -135,6 +237,8 @@ class Event(object):
 
 class Message(Event):
 
+    __slots__ = ("type", "content")
+
     def __init__(self, type, date, person, content):
         super().__init__(date, person)
         self.type = type
@@ -149,8 +253,15 @@ class Message(Event):
         })
 
 
+class Emoji(Message):
+
+    __slots__ = ()
+
+
 class Attachment(Event):
 
+    __slots__ = ("content", "_mimetype")
+
     @property
     def type(self):
         return EventType.ATTACHMENT
@@ -164,7 +275,11 @@ class Attachment(Event):
 
     @property
     def mimetype(self):
-        return mimetypes.guess_type(self.content)[0]
+        try:
+            return self._mimetype
+        except AttributeError:
+            self._mimetype = mimetypes.guess_type(self.content)[0]
+            return self._mimetype
 
     @property
     def base64_data(self):
@@ -178,6 +293,8 @@ class Attachment(Event):
 
 class Image(Attachment):
 
+    __slots__ = ("size",)
+
     def __init__(self, date, person, content, size):
         super(Image, self).__init__(date=date, person=person, content=content)
         self.size = size
@@ -189,6 +306,18 @@ class Image(Attachment):
 
 class Video(Attachment):
 
+    __slots__ = ()
+
     @property
     def type(self):
         return EventType.VIDEO
+
+
+# Gives each event imported from `source` a deterministic identifier derived from its source, type, date, sender, and
+# content; identical events within a source are distinguished by their order.
+def identify_events(source, events):
+    occurrences = collections.Counter()
+    for event in events:
+        components = (source, event.type.value, event.date.isoformat(), event.person.id, event.content)
+        occurrences[components] += 1
+        event.identify(source, stable_id(*components, str(occurrences[components])))
@@ -0,0 +1,163 @@
+# Copyright (c) 2021-2024 Jason Morley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import collections
+import contextlib
+import cProfile
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# `ru_maxrss` is reported in kilobytes on Linux, and in bytes on macOS.
+MAXRSS_SCALE = 1 if sys.platform == "darwin" else 1024
+
+
+# The peak resident set size of the process so far.
+def peak_rss():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * MAXRSS_SCALE
+
+
+class Stage(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.peak_traced_memory = None
+        self.rss_high_water_delta = None
+        self.counts = {}
+
+    def count(self, **counts):
+        self.counts.update(counts)
+
+    def json(self):
+        return {"name": self.name,
+                "wall_time": self.wall_time,
+                "cpu_time": self.cpu_time,
+                "peak_traced_memory": self.peak_traced_memory,
+                "rss_high_water_delta": self.rss_high_water_delta,
+                "counts": self.counts}
+
+
+# Records the wall and CPU time, memory use, and item counts of each stage of a run, along with the throughput of each
+# imported source. Time and counts are cheap to collect, so they're always recorded; tracing memory allocations slows
+# the run considerably, so it's only enabled with `trace_memory`. The process's peak RSS is only known as a high-water
+# mark, so it's reported for the whole run, and each stage reports how much the high-water mark rose during it (zero
+# for stages that stay below an earlier peak). If `profile_directory` is set, each stage is also run
+# under cProfile, and its statistics written to '{stage}.prof' in that directory.
+class Profiler(object):
+
+    def __init__(self, trace_memory=False, profile_directory=None):
+        self.trace_memory = trace_memory
+        self.profile_directory = profile_directory
+        self.stages = []
+        self.sources = []
+        self.start_time = time.perf_counter()
+        self.start_cpu_time = time.process_time()
+        if self.trace_memory:
+            tracemalloc.start()
+        if self.profile_directory is not None:
+            os.makedirs(self.profile_directory, exist_ok=True)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        stage = Stage(name)
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        profile = cProfile.Profile() if self.profile_directory is not None else None
+        wall_time = time.perf_counter()
+        cpu_time = time.process_time()
+        rss = peak_rss()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield stage
+        finally:
+            if profile is not None:
+                profile.disable()
+            stage.wall_time = time.perf_counter() - wall_time
+            stage.cpu_time = time.process_time() - cpu_time
+            if self.trace_memory:
+                _, stage.peak_traced_memory = tracemalloc.get_traced_memory()
+            if rss is not None:
+                stage.rss_high_water_delta = peak_rss() - rss
+            if profile is not None:
+                profile.dump_stats(os.path.join(self.profile_directory, f"{stage.name}.prof"))
+            self.stages.append(stage)
+
+    # `duration` is the time taken to import (or load from the cache) the events of the source at `path`.
+    def source(self, importer, path, events, duration, is_cached):
+        self.sources.append({"importer": importer,
+                             "path": path,
+                             "events": events,
+                             "duration": duration,
+                             "events_per_second": events / duration if duration > 0 else None,
+                             "cached": is_cached})
+
+    def importers(self):
+        importers = collections.defaultdict(lambda: {"sources": 0, "events": 0, "duration": 0.0})
+        for source in self.sources:
+            summary = importers[source["importer"]]
+            summary["sources"] += 1
+            summary["events"] += source["events"]
+            summary["duration"] += source["duration"]
+        for summary in importers.values():
+            summary["events_per_second"] = summary["events"] / summary["duration"] if summary["duration"] > 0 else None
+        return dict(importers)
+
+    def json(self):
+        return {"python": platform.python_version(),
+                "platform": platform.platform(),
+                "wall_time": time.perf_counter() - self.start_time,
+                "cpu_time": time.process_time() - self.start_cpu_time,
+                "peak_rss": peak_rss(),
+                "stages": [stage.json() for stage in self.stages],
+                "importers": self.importers(),
+                "sources": self.sources}
+
+    def write(self, path):
+        with open(path, "w") as fh:
+            json.dump(self.json(), fh, indent=2)
+
+    def log(self):
+        for stage in self.stages:
+            memory = "" if stage.peak_traced_memory is None else f", {stage.peak_traced_memory / 1048576:.1f} MiB traced"
+            counts = "".join(f", {value} {key}" for key, value in stage.counts.items())
+            logging.info("%s: %.3fs wall, %.3fs CPU%s%s", stage.name, stage.wall_time, stage.cpu_time, memory, counts)
+        for importer, summary in sorted(self.importers().items()):
+            rate = summary["events_per_second"]
+            logging.info("%s: %d events from %d sources in %.3fs (%s events/s)", importer, summary["events"],
+                         summary["sources"], summary["duration"], "-" if rate is None else f"{rate:.0f}")
+
+    def close(self):
+        if self.trace_memory:
+            tracemalloc.stop()
@@ -0,0 +1,132 @@
+# Copyright (c) 2021-2024 Jason Morley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import collections
+import functools
+import json
+import os
+import re
+import sys
+import unicodedata
+
+import utilities
+
+
+# Terms are sharded by their first `SHARD_PREFIX_LENGTH` characters, so that a query only needs to load the shards for
+# the terms it contains.
+SHARD_PREFIX_LENGTH = 2
+
+MANIFEST_FILENAME = "manifest.json"
+
+ASCII_TERM_EXPRESSION = re.compile(r"[a-z0-9_]+")
+
+
+# Translation table which removes marks (stripping diacritics from decomposed text) and replaces every character other
+# than letters, numbers and underscores with a space. Characters are classified on first use.
+class TermCharacterTable(dict):
+
+    def __missing__(self, codepoint):
+        category = unicodedata.category(chr(codepoint))
+        if category[0] == "M":
+            value = None
+        elif category[0] in "LN" or codepoint == ord("_"):
+            value = codepoint
+        else:
+            value = ord(" ")
+        self[codepoint] = value
+        return value
+
+
+TERM_CHARACTER_TABLE = TermCharacterTable()
+
+
+# Characters whose case folding differs from their lowercase mapping (e.g., 'ß' and final sigma), which are written to
+# the index manifest so that `static/js/search.js` can fold case exactly as `terms` does.
+@functools.lru_cache(maxsize=None)
+def case_folds():
+    folds = {}
+    for codepoint in range(sys.maxunicode + 1):
+        character = chr(codepoint)
+        folded = character.casefold()
+        if folded != character.lower():
+            folds[character] = folded
+    return folds
+
+
+# Splits text into case-folded terms, without diacritics: the text is decomposed (NFKD), case-folded, decomposed again,
+# stripped of marks, and split into runs of letters, numbers and underscores. `static/js/search.js` tokenizes queries
+# in exactly the same way.
+def terms(text):
+    if text.isascii():
+        return ASCII_TERM_EXPRESSION.findall(text.lower())
+    text = unicodedata.normalize("NFKD", unicodedata.normalize("NFKD", text).casefold())
+    return text.translate(TERM_CHARACTER_TABLE).split()
+
+
+def shard_key(term):
+    return term[:SHARD_PREFIX_LENGTH].encode("utf-8").hex()
+
+
+# Accumulates the postings for the events of a single conversation. Each posting is a list containing the ordinal of the
+# event within the conversation (its index in chronological order, which also locates its exported chunk) followed by
+# the positions of the term within the event, delta-encoded.
+class Postings(object):
+
+    def __init__(self):
+        self.terms = collections.defaultdict(list)
+
+    def add(self, ordinal, text):
+        positions = collections.defaultdict(list)
+        for position, term in enumerate(terms(text)):
+            positions[term].append(position)
+        for term, term_positions in positions.items():
+            self.terms[term].append([ordinal] + [position - previous
+                                                 for previous, position in zip([0] + term_positions, term_positions)])
+
+    def json(self):
+        return json.dumps(self.terms, sort_keys=True, separators=(",", ":"))
+
+
+# Merges the postings of each conversation (read from the files written by `Postings`) into shards in `directory`,
+# prefixing each posting with the index of its conversation in the manifest. Shards whose contents haven't changed
+# are left untouched, and shards that are no longer needed are removed.
+def write_index(directory, conversations):
+    shards = collections.defaultdict(lambda: collections.defaultdict(list))
+    for index, (_, path) in enumerate(conversations):
+        with open(path) as fh:
+            for term, postings in json.load(fh).items():
+                shards[shard_key(term)][term].extend([index] + posting for posting in postings)
+
+    os.makedirs(directory, exist_ok=True)
+    basenames = {MANIFEST_FILENAME}
+    for key, shard in shards.items():
+        basename = f"{key}.json"
+        utilities.write_if_changed(os.path.join(directory, basename),
+                                   json.dumps(shard, sort_keys=True, separators=(",", ":")))
+        basenames.add(basename)
+    for path in utilities.glob(directory, "*.json"):
+        if os.path.basename(path) not in basenames:
+            os.remove(path)
+    manifest = {"prefix_length": SHARD_PREFIX_LENGTH,
+                "conversations": [id for id, _ in conversations],
+                "shards": sorted(shards.keys()),
+                "folds": case_folds()}
+    utilities.write_if_changed(os.path.join(directory, MANIFEST_FILENAME), json.dumps(manifest))
+    return len(shards)
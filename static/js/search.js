@@ -0,0 +1,122 @@
+// Searches the static index written to `data/search` by `search_index.py`, without needing a server. The index is
+// sharded by the first characters of each term, so a query only loads the shards for the terms it contains; matching
+// events are then loaded from the exported conversation chunks in `data/conversations`.
+
+const SEARCH_RESULT_LIMIT = 50;
+
+const searchCache = new Map();
+
+function fetchJSON(path) {
+    if (!searchCache.has(path)) {
+        const promise = fetch(path).then((response) => {
+            if (response.status == 404) {
+                return null;
+            }
+            if (!response.ok) {
+                throw new Error(`Unable to load '${path}' (${response.status}).`);
+            }
+            return response.json();
+        });
+        promise.catch(() => searchCache.delete(path));
+        searchCache.set(path, promise);
+    }
+    return searchCache.get(path);
+}
+
+// Matches `search_index.terms`: the text is decomposed (NFKD), case-folded, decomposed again, stripped of marks, and
+// split into runs of letters, numbers and underscores. JavaScript has no case folding, so characters whose case folding
+// differs from their lowercase mapping are folded using `folds`, which is written to the index manifest by Python.
+function searchTerms(text, folds) {
+    const folded = Array.from(text.normalize("NFKD"), (character) => folds[character] ?? character.toLowerCase()).join("");
+    return folded.normalize("NFKD").replace(/\p{M}/gu, "").match(/[\p{L}\p{N}_]+/gu) || [];
+}
+
+function shardKey(term, prefixLength) {
+    const prefix = Array.from(term).slice(0, prefixLength).join("");
+    return Array.from(new TextEncoder().encode(prefix), (byte) => byte.toString(16).padStart(2, "0")).join("");
+}
+
+// Returns the postings for `term`, or, if `prefix` is set, the postings for every term beginning with `term`.
+async function termPostings(manifest, term, prefix) {
+    const key = shardKey(term, manifest.prefix_length);
+    if (!manifest.shards.includes(key)) {
+        return [];
+    }
+    const shard = await fetchJSON(`search/${key}.json`);
+    if (!prefix) {
+        return shard[term] || [];
+    }
+    return Object.keys(shard).filter((candidate) => candidate.startsWith(term)).flatMap((candidate) => shard[candidate]);
+}
+
+// Returns the (conversation, ordinal) pairs of the events containing every term in `query`; the last term is treated
+// as a prefix, so that results appear while typing.
+async function searchIndex(query) {
+    const manifest = await fetchJSON("search/manifest.json");
+    if (!manifest) {
+        return [];
+    }
+    const terms = searchTerms(query, manifest.folds);
+    if (terms.length == 0) {
+        return [];
+    }
+    let matches = null;
+    for (const [index, term] of terms.entries()) {
+        const prefix = index == terms.length - 1 && term.length >= manifest.prefix_length;
+        const events = new Set((await termPostings(manifest, term, prefix)).map(([conversation, ordinal]) => `${conversation}:${ordinal}`));
+        matches = matches === null ? events : new Set([...matches].filter((match) => events.has(match)));
+        if (matches.size == 0) {
+            return [];
+        }
+    }
+    return [...matches].map((match) => {
+        const [conversation, ordinal] = match.split(":").map(Number);
+        return {conversation: manifest.conversations[conversation], ordinal: ordinal};
+    });
+}
+
+// Loads the exported event with the given ordinal (its index in chronological order) from its chunk.
+async function loadEvent(conversationId, ordinal) {
+    const manifest = await fetchJSON(`conversations/${conversationId}/manifest.json`);
+    const index = Math.floor(ordinal / manifest.chunk_size);
+    const chunk = manifest.chunks[manifest.chunks.length - 1 - index];
+    const events = await fetchJSON(`conversations/${conversationId}/${chunk.path}`);
+    return {manifest: manifest, event: events[chunk.count - 1 - ordinal % manifest.chunk_size]};
+}
+
+function renderSearchResult(manifest, event) {
+    const item = document.createElement("li");
+    const link = document.createElement("a");
+    link.href = `${manifest.id}.html`;
+    const title = document.createElement("div");
+    title.className = "search-result-title";
+    const person = manifest.people[event.person];
+    title.textContent = `${manifest.name} · ${person ? person.name : ""} · ${new Date(event.date).toLocaleString()}`;
+    const content = document.createElement("div");
+    content.className = "search-result-content";
+    content.innerHTML = event.content;
+    link.appendChild(title);
+    link.appendChild(content);
+    item.appendChild(link);
+    return item;
+}
+
+function renderSearch(form, input, list) {
+    let generation = 0;
+    form.onsubmit = (e) => e.preventDefault();
+    input.oninput = async () => {
+        const current = ++generation;
+        try {
+            const matches = await searchIndex(input.value);
+            const results = await Promise.all(matches.slice(0, SEARCH_RESULT_LIMIT)
+                .map(({conversation, ordinal}) => loadEvent(conversation, ordinal)));
+            if (current != generation) {
+                return;
+            }
+            results.sort((a, b) => b.event.date.localeCompare(a.event.date));
+            list.replaceChildren(...results.map(({manifest, event}) => renderSearchResult(manifest, event)));
+        } catch (error) {
+            console.error(error);
+        }
+    };
+}
@@ -1,3 +1,23 @@
 function copyToClipboard(text) {
     navigator.clipboard.writeText(text);
 }
+
+// Renders the list of conversations defined in `conversations.js`, which is generated once and shared by every page.
+function renderConversations(list, activeConversationId) {
+    for (const conversation of conversations) {
+        const item = document.createElement("li");
+        const link = document.createElement("a");
+        link.title = conversation.sources.join(", ");
+        link.href = `${conversation.id}.html`;
+        if (conversation.id == activeConversationId) {
+            link.className = "active";
+        }
+        link.appendChild(document.createTextNode(conversation.name + " "));
+        const button = document.createElement("button");
+        button.textContent = "Copy";
+        button.onclick = () => copyToClipboard(conversation.configuration);
+        link.appendChild(button);
+        item.appendChild(link);
+        list.appendChild(item);
+    }
+}
@@ -18,15 +18,30 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import collections
+import contextlib
 import datetime
+import hashlib
+import itertools
 import json
 import logging
 import os.path
+import queue
 import sqlite3
 import time
+import urllib.parse
 
 import dateutil.parser
 
+import utilities
+
+
+SearchResult = collections.namedtuple('SearchResult', ['event', 'conversation', 'timestamp', 'snippet', 'rank'])
+UpdateSummary = collections.namedtuple('UpdateSummary', ['sources', 'changed', 'written', 'removed'])
+Record = collections.namedtuple('Record', ['id', 'name'])
+EventRecord = collections.namedtuple('EventRecord', ['id', 'type', 'timestamp', 'person', 'content'])
+Page = collections.namedtuple('Page', ['events', 'next'])
+
 
 class Metadata(object):
 
@@ -58,20 +73,326 @@ def create_initial_tables(cursor):
         """)
 
 
+# Event types whose content is indexed for search.
+SEARCHABLE_TYPES = {"message", "emoji"}
+
+
+# The search index is populated by `index_events_by_key`, which replaces it.
+def create_search_index(cursor):
+    cursor.execute("""
+        CREATE VIRTUAL TABLE events_search USING fts5 (
+            text,
+            event UNINDEXED,
+            conversation UNINDEXED,
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+        """)
+
+
+def search_text(type, content):
+    if type not in SEARCHABLE_TYPES:
+        return None
+    return utilities.html_to_text(content)
+
+
+# Records the source of each event, and a digest of the events imported from each source, allowing the database to be
+# updated incrementally.
+def track_sources(cursor):
+    cursor.execute("ALTER TABLE events ADD COLUMN source TEXT")
+    cursor.execute("CREATE INDEX events_source ON events (source)")
+    cursor.execute("""
+        CREATE TABLE sources (
+            path TEXT PRIMARY KEY,
+            digest TEXT NOT NULL
+        )
+        """)
+
+
+# Secondary indexes are dropped while bulk loading and recreated once the data is in place.
+INDEXES = {
+    "events_conversation_timestamp": "CREATE INDEX IF NOT EXISTS events_conversation_timestamp ON events (conversation, timestamp, id)",
+    "events_person": "CREATE INDEX IF NOT EXISTS events_person ON events (person)",
+}
+
+
+def create_indexes(cursor):
+    for statement in INDEXES.values():
+        cursor.execute(statement)
+
+
+# Includes the event identifier in the conversation index, allowing events to be paged through by (timestamp, id).
+def index_events_by_identifier(cursor):
+    cursor.execute("DROP INDEX IF EXISTS events_conversation_timestamp")
+    create_indexes(cursor)
+
+
+# Rebuilds the events table with an explicit integer key (which, unlike an implicit rowid, is preserved by VACUUM) and
+# the plain text of each searchable event, and replaces the search index with an external content table keyed by it.
+# Triggers keep the search index in step with the events table.
+def index_events_by_key(cursor):
+    cursor.execute("DROP TABLE events_search")
+    cursor.execute("""
+        CREATE TABLE events_keyed (
+            key INTEGER PRIMARY KEY,
+            id TEXT NOT NULL UNIQUE,
+            type TEXT,
+            timestamp TIMESTAMP,
+            person TEXT NOT NULL,
+            conversation TEXT NOT NULL,
+            content JSON,
+            source TEXT,
+            text TEXT
+        )
+        """)
+    rows = cursor.connection.execute("SELECT id, type, timestamp, person, conversation, content, source FROM events")
+    cursor.executemany(f"INSERT INTO events_keyed ({EVENT_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                       (row + (search_text(row[1], json.loads(row[5]).get("content")),) for row in rows))
+    cursor.execute("DROP TABLE events")
+    cursor.execute("ALTER TABLE events_keyed RENAME TO events")
+    cursor.execute("CREATE INDEX events_source ON events (source)")
+    create_indexes(cursor)
+    cursor.execute("""
+        CREATE VIRTUAL TABLE events_search USING fts5 (
+            text,
+            content = 'events',
+            content_rowid = 'key',
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+        """)
+    cursor.execute("""
+        CREATE TRIGGER events_search_insert AFTER INSERT ON events WHEN new.text IS NOT NULL BEGIN
+            INSERT INTO events_search (rowid, text) VALUES (new.key, new.text);
+        END
+        """)
+    cursor.execute("""
+        CREATE TRIGGER events_search_delete AFTER DELETE ON events WHEN old.text IS NOT NULL BEGIN
+            INSERT INTO events_search (events_search, rowid, text) VALUES ('delete', old.key, old.text);
+        END
+        """)
+    cursor.execute("""
+        CREATE TRIGGER events_search_update AFTER UPDATE OF text ON events BEGIN
+            INSERT INTO events_search (events_search, rowid, text)
+                SELECT 'delete', old.key, old.text WHERE old.text IS NOT NULL;
+            INSERT INTO events_search (rowid, text) SELECT new.key, new.text WHERE new.text IS NOT NULL;
+        END
+        """)
+    cursor.execute("INSERT INTO events_search (events_search) VALUES ('rebuild')")
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def conversation_events(conversations):
+    for conversation in conversations:
+        for batch in conversation.batches:
+            for event in batch.events:
+                yield event, conversation
+
+
+EVENT_COLUMNS = "id, type, timestamp, person, conversation, content, source, text"
+
+
+def event_row(event, conversation):
+    return (event.id, event.type.value, event.date, event.person.id, conversation.id, event.json(), event.source,
+            search_text(event.type.value, event.content))
+
+
 class Cursor(sqlite3.Cursor):
 
+    CHUNK_SIZE = 10000
+
     def add_event(self, event, conversation):
-        self.execute("INSERT INTO events VALUES (?, ?, ?, ?, ?, ?)",
-                     (event.id, event.type.value, event.date, event.person.id, conversation.id, event.json()))
+        self.add_events([(event, conversation)])
+
+    # Expects an iterable of (event, conversation) tuples.
+    def add_events(self, events):
+        count = 0
+        for chunk in chunks(events, self.CHUNK_SIZE):
+            self.executemany(f"INSERT INTO events ({EVENT_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                             (event_row(event, conversation) for event, conversation in chunk))
+            count += len(chunk)
+            logging.debug("Inserted %d events...", count)
+        return count
 
     def add_person(self, person):
         self.execute("INSERT INTO people VALUES (?, ?)",
                      (person.id, person.name))
 
+    def add_people(self, people):
+        self.executemany("INSERT INTO people VALUES (?, ?)",
+                         ((person.id, person.name) for person in people))
+
     def add_conversation(self, conversation):
         self.execute("INSERT INTO conversations VALUES (?, ?)",
                      (conversation.id, conversation.name))
 
+    def add_conversations(self, conversations):
+        self.executemany("INSERT INTO conversations VALUES (?, ?)",
+                         ((conversation.id, conversation.name) for conversation in conversations))
+
+    def remove_events(self, ids):
+        for chunk in chunks(ids, self.CHUNK_SIZE):
+            self.executemany("DELETE FROM events WHERE id = ?", ((id,) for id in chunk))
+
+    # Replaces the contents of a table of (id, name) rows, leaving rows that are unchanged untouched.
+    def update_names(self, table, rows):
+        rows = dict(rows)
+        self.executemany(f"""
+            INSERT INTO {table} VALUES (?, ?)
+                ON CONFLICT (id) DO UPDATE SET name = excluded.name WHERE name != excluded.name
+            """, rows.items())
+        existing = {id for id, in self.execute(f"SELECT id FROM {table}")}
+        self.executemany(f"DELETE FROM {table} WHERE id = ?", ((id,) for id in existing - rows.keys()))
+
+    def sources(self):
+        return dict(self.execute("SELECT path, digest FROM sources"))
+
+    # Brings the events from `source` in line with `events`, an iterable of (event, conversation) tuples, only writing
+    # events that are new or whose type or conversation have changed. Returns the number of events written and removed.
+    def update_source(self, source, digest, events):
+        existing = {id: (type, conversation)
+                    for id, type, conversation in self.execute("SELECT id, type, conversation FROM events WHERE source IS ?",
+                                                               (source,))}
+        events = list(events)
+        ids = {event.id for event, _ in events}
+        changed = [(event, conversation)
+                   for event, conversation in events
+                   if existing.get(event.id) != (event.type.value, conversation.id)]
+        stale = [id for id in existing.keys() if id not in ids]
+        self.remove_events(stale + [event.id for event, _ in changed if event.id in existing])
+        self.add_events(changed)
+        if source is not None:
+            self.execute("INSERT OR REPLACE INTO sources VALUES (?, ?)", (source, digest))
+        return len(changed), len(stale)
+
+    def remove_source(self, source):
+        ids = [id for id, in self.execute("SELECT id FROM events WHERE source IS ?", (source,))]
+        self.remove_events(ids)
+        self.execute("DELETE FROM sources WHERE path IS ?", (source,))
+        return len(ids)
+
+    # Updates the database to match `people` and `conversations` in place. Sources whose events are unchanged since the
+    # last update (as determined by their digest) are skipped entirely, events from sources that no longer exist are
+    # removed, and events without a source are always rewritten.
+    def update(self, people, conversations):
+        self.update_names("people", ((person.id, person.name) for person in people))
+        self.update_names("conversations", ((conversation.id, conversation.name) for conversation in conversations))
+
+        digests = collections.defaultdict(hashlib.sha256)
+        for event, conversation in conversation_events(conversations):
+            digests[event.source].update(f"{event.id} {event.type.value} {conversation.id}\n".encode())
+        digests = {source: digest.hexdigest() for source, digest in digests.items()}
+        existing = self.sources()
+        changed = {source for source, digest in digests.items() if source is None or existing.get(source) != digest}
+
+        events = collections.defaultdict(list)
+        for event, conversation in conversation_events(conversations):
+            if event.source in changed:
+                events[event.source].append((event, conversation))
+        summary = UpdateSummary(sources=len(digests), changed=len(changed), written=0, removed=0)
+        for source in changed:
+            written, removed = self.update_source(source, digests[source], events.pop(source))
+            summary = summary._replace(written=summary.written + written, removed=summary.removed + removed)
+        for source in (existing.keys() | {None}) - digests.keys():
+            summary = summary._replace(removed=summary.removed + self.remove_source(source))
+        logging.info("Updated %d of %d sources (%d events written, %d removed).",
+                     summary.changed, summary.sources, summary.written, summary.removed)
+        return summary
+
+
+# The queries below take a connection, so that they can be used with both a `Store` and a `ConnectionPool`.
+
+def people(connection):
+    return [Record(*row) for row in connection.execute("SELECT id, name FROM people ORDER BY name, id")]
+
+
+def conversations(connection):
+    return [Record(*row) for row in connection.execute("SELECT id, name FROM conversations ORDER BY name, id")]
+
+
+def conversation(connection, id):
+    row = connection.execute("SELECT id, name FROM conversations WHERE id = ?", (id,)).fetchone()
+    return Record(*row) if row is not None else None
+
+
+# Returns a page of up to `limit` events from a conversation, newest first, starting immediately before the
+# (timestamp, id) tuple `before` if specified. Pages are located using the conversation index (keyset pagination), so
+# fetching a page costs the same regardless of how far back it is. `Page.next` is the `before` for the following page.
+def events(connection, conversation, before=None, limit=100):
+    statement = "SELECT id, type, timestamp, person, content FROM events WHERE conversation = ?"
+    parameters = [conversation]
+    if before is not None:
+        statement += " AND (timestamp, id) < (?, ?)"
+        parameters.extend(before)
+    statement += " ORDER BY timestamp DESC, id DESC LIMIT ?"
+    parameters.append(limit + 1)
+    rows = [EventRecord(*row) for row in connection.execute(statement, parameters)]
+    if len(rows) <= limit:
+        return Page(events=rows, next=None)
+    rows = rows[:limit]
+    return Page(events=rows, next=(rows[-1].timestamp, rows[-1].id))
+
+
+# Returns messages matching an FTS5 query (e.g., `jonty`, `"happy birthday"`, or `pub OR beer`), best match first.
+def search(connection, query, conversation=None, limit=50, offset=0, highlight=("<mark>", "</mark>")):
+    statement = """
+        SELECT events.id, events.conversation, events.timestamp,
+               snippet(events_search, 0, ?, ?, '…', 16), events_search.rank
+          FROM events_search
+          JOIN events ON events.key = events_search.rowid
+         WHERE events_search MATCH ?
+        """
+    parameters = [highlight[0], highlight[1], query]
+    if conversation is not None:
+        statement += " AND events.conversation = ?"
+        parameters.append(conversation)
+    statement += " ORDER BY events_search.rank LIMIT ? OFFSET ?"
+    parameters.extend([limit, offset])
+    return [SearchResult(*row) for row in connection.execute(statement, parameters)]
+
+
+def connect_read_only(path):
+    uri = "file:" + urllib.parse.quote(os.path.abspath(path)) + "?mode=ro"
+    connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    connection.execute("PRAGMA query_only = ON")
+    return connection
+
+
+# A fixed set of read-only connections to the database at `path`, shared between threads; `connection()` blocks until
+# one is available.
+class ConnectionPool(object):
+
+    def __init__(self, path, size=4):
+        self.path = path
+        self.connections = queue.Queue()
+        for _ in range(size):
+            self.connections.put(connect_read_only(path))
+        self.size = size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @contextlib.contextmanager
+    def connection(self):
+        connection = self.connections.get()
+        try:
+            yield connection
+        finally:
+            self.connections.put(connection)
+
+    def close(self):
+        for _ in range(self.size):
+            self.connections.get().close()
+
 
 class Transaction(object):
 
@@ -93,10 +414,15 @@ class Transaction(object):
 
 class Store(object):
 
-    SCHEMA_VERSION = 1
+    SCHEMA_VERSION = 6
 
     MIGRATIONS = {
         1: create_initial_tables,
+        2: create_indexes,
+        3: create_search_index,
+        4: track_sources,
+        5: index_events_by_identifier,
+        6: index_events_by_key,
     }
 
     def __init__(self, path):
@@ -109,7 +435,7 @@ class Store(object):
 
         # Create the initial version if necessary.
         with Transaction(self.connection) as cursor:
-            cursor.execute("INSERT INTO metadata VALUES (?, ?)",
+            cursor.execute("INSERT OR IGNORE INTO metadata VALUES (?, ?)",
                            (Metadata.SCHEMA_VERSION, 0))
 
         self.migrate()
@@ -141,3 +467,34 @@ class Store(object):
 
     def transaction(self):
         return Transaction(self.connection, cursor_class=Cursor)
+
+    def is_empty(self):
+        with Transaction(self.connection) as cursor:
+            return cursor.execute("SELECT NOT EXISTS (SELECT 1 FROM events)").fetchone()[0] == 1
+
+    def search(self, query, conversation=None, limit=50, offset=0, highlight=("<mark>", "</mark>")):
+        return search(self.connection, query, conversation=conversation, limit=limit, offset=offset, highlight=highlight)
+
+    # Tunes the connection for loading large amounts of data: uses WAL journaling with relaxed synchronization, and
+    # defers building secondary indexes until the load is complete. The previous settings are restored afterwards.
+    @contextlib.contextmanager
+    def bulk_load(self):
+        cursor = self.connection.cursor()
+        try:
+            journal_mode = cursor.execute("PRAGMA journal_mode").fetchone()[0]
+            synchronous = cursor.execute("PRAGMA synchronous").fetchone()[0]
+            cursor.execute("PRAGMA journal_mode = WAL")
+            cursor.execute("PRAGMA synchronous = OFF")
+            with Transaction(self.connection) as transaction:
+                for name in INDEXES.keys():
+                    transaction.execute(f"DROP INDEX IF EXISTS {name}")
+            try:
+                yield
+            finally:
+                logging.debug("Creating indexes...")
+                with Transaction(self.connection) as transaction:
+                    create_indexes(transaction)
+                cursor.execute(f"PRAGMA synchronous = {synchronous}")
+                cursor.execute(f"PRAGMA journal_mode = {journal_mode}")
+        finally:
+            cursor.close()
@@ -0,0 +1,42 @@
+# Copyright (c) 2021-2024 Jason Morley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import datetime
+
+import pytz
+
+import model
+
+
+# Returns a conversation of `count` messages, alternating between two people. Pairs of events share timestamps, to
+# ensure that events are ordered by identifier too. Events are given deterministic identifiers if `source` is set.
+def conversation(count, source=None):
+    primary = model.Person(name="Jason Morley", is_primary=True)
+    person = model.Person(name="Pavlos Vinieratos", is_primary=False)
+    start = datetime.datetime(2022, 6, 29, 15, 25, 18).replace(tzinfo=pytz.utc)
+    events = [model.Message(type=model.EventType.MESSAGE,
+                            date=start + datetime.timedelta(seconds=i // 2),
+                            person=person if i % 2 else primary,
+                            content=f"<p>Message {i}</p>")
+              for i in range(count)]
+    if source is not None:
+        model.identify_events(source, events)
+    return model.Conversation(sources=[source] if source is not None else [], people=[primary, person],
+                              batches=[model.Batch(date=start, person=person, events=events)])
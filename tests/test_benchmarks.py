@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2021-2024 Jason Morley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestPipelineBenchmark(unittest.TestCase):
+
+    # Runs the benchmark end to end on a tiny corpus, and compares it against itself as a baseline.
+    def test_pipeline(self):
+        with tempfile.TemporaryDirectory() as directory:
+            command = [sys.executable, os.path.join(ROOT_DIRECTORY, "benchmarks", "pipeline.py"),
+                       "--messages", "60", "--messages-per-source", "25", "--contacts", "2",
+                       "--corpus", os.path.join(directory, "corpus")]
+            results_path = os.path.join(directory, "results.json")
+            subprocess.run(command + ["--output", results_path], check=True, capture_output=True, cwd=directory)
+            with open(results_path) as fh:
+                results = json.load(fh)
+            self.assertEqual(set(results["stages"].keys()),
+                             {"import_messages.whatsapp_ios", "import_messages.msn_messenger",
+                              "import_messages.text_archive", "import_messages.received_files",
+                              "merge_events", "group_events", "render", "search_index", "store"})
+            for format in ["whatsapp_ios", "msn_messenger", "text_archive"]:
+                self.assertEqual(results["stages"][f"import_messages.{format}"]["items"], 60, format)
+            self.assertEqual(results["stages"]["store"]["items"], 181)
+            subprocess.run(command + ["--baseline", results_path, "--tolerance", "60"], check=True, capture_output=True,
+                           cwd=directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+# Copyright (c) 2021-2024 Jason Morley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import datetime
+import os
+import tempfile
+import types
+import unittest
+
+import pytz
+
+import cache
+import model
+
+
+def import_messages(context, media_destination_path, path):
+    with open(path) as fh:
+        content = fh.read()
+    events = [model.Message(type=model.EventType.MESSAGE,
+                            date=datetime.datetime(2022, 6, 29, 15, 25, 18).replace(tzinfo=pytz.utc),
+                            person=context.person(identifier=identifier),
+                            content=content)
+              for identifier in ["Jason Morley", "Pavlos Vinieratos"]]
+    return [model.Session(sources=[path],
+                          people=[event.person for event in events] + [context.people.primary],
+                          events=events)]
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.people = model.People()
+        self.primary = model.Person(name="Jason Morley", is_primary=True)
+        self.people.people["Jason Morley"] = self.primary
+        self.context = model.ImportContext(people=self.people)
+        self.importer = types.SimpleNamespace(__name__="test_importer", VERSION=1, import_messages=import_messages)
+
+    def test_load_sessions_reconciles_people(self):
+        detached_context = model.ImportContext(people=model.DetachedPeople())
+        sessions = import_messages(detached_context, None, __file__)
+        sessions = model.load_sessions(model.dump_sessions(sessions, detached_context.people), self.context)
+        self.assertEqual(len(sessions), 1)
+        session = sessions[0]
+        self.assertIs(session.events[0].person, self.primary)
+        self.assertIs(session.events[1].person, self.people.person(identifier="Pavlos Vinieratos"))
+        self.assertEqual(len(session.people), 2)
+
+    def import_messages(self, session_cache, path):
+        key, data = session_cache.lookup(self.importer, path)
+        if data is None:
+            detached_context = model.ImportContext(people=model.DetachedPeople())
+            sessions = import_messages(detached_context, None, path)
+            data = model.dump_sessions(sessions, detached_context.people)
+            session_cache.store(key, data, cache.attachments(sessions))
+        return model.load_sessions(data, self.context)
+
+    def test_lookup(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "chat.txt")
+            with open(path, "w") as fh:
+                fh.write("hey hey")
+            with cache.SessionCache(os.path.join(directory, "cache"), directory) as session_cache:
+                sessions = self.import_messages(session_cache, path)
+                self.assertEqual(sessions[0].events[0].content, "hey hey")
+                sessions = self.import_messages(session_cache, path)
+                self.assertEqual(sessions[0].events[0].content, "hey hey")
+                self.assertIs(sessions[0].events[0].person, self.primary)
+                self.assertEqual((session_cache.hits, session_cache.misses), (1, 1))
+
+                # Changing the source invalidates the entry.
+                with open(path, "w") as fh:
+                    fh.write("hello")
+                sessions = self.import_messages(session_cache, path)
+                self.assertEqual(sessions[0].events[0].content, "hello")
+                self.assertEqual((session_cache.hits, session_cache.misses), (1, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+# Copyright (c) 2021-2024 Jason Morley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import re
+import unittest
+
+import emoticons
+
+
+# The original implementation, which applies each emoticon in turn.
+def detect_sequential(text):
+    for string, emoji in emoticons.EMOTICONS.items():
+        text = re.sub(re.escape(string), emoji, text, flags=re.IGNORECASE)
+    return text
+
+
+class TestEmoticons(unittest.TestCase):
+
+    def test_detect_matches_sequential(self):
+        for text in ["",
+                     "No emoticons here.",
+                     "Hello :-) how are you? :)",
+                     "Ha :D :-d :P :p ;-) ;) :( :-( :S :s :| :-| :'( :$ :-$",
+                     "(h) (H) (N) ({) (}) (T) (I) (8) (S) |-)",
+                     "Mixed: (brackets) and: colons; without emoticons",
+                     "Adjacent:):):-):D"]:
+            self.assertEqual(emoticons.detect(text), detect_sequential(text), text)
+
+    def test_detect_longest_match(self):
+        self.assertEqual(emoticons.detect("Party <:o)"), "Party 🥳")
+        self.assertEqual(emoticons.detect("<:O)"), "🥳")
+
+    def test_detect_case_folded_variants(self):
+        for text, expected in [(":ſ", "😕"), (":-ſ", "😕"), ("(İ)", "💡"), ("(ı)", "💡"), ("(ſ) :-K", "🌘 :-K")]:
+            self.assertEqual(emoticons.detect(text), expected, text)
+            self.assertEqual(emoticons.detect(text), detect_sequential(text), text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+# Copyright (c) 2021-2024 Jason Morley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import tempfile
+import unittest
+
+from PIL import Image as Img
+
+import images
+
+
+class TestImages(unittest.TestCase):
+
+    def assertHeaderSize(self, path, size):
+        with open(path, "rb") as fh:
+            self.assertEqual(tuple(images.header_size(fh)), size)
+        self.assertEqual(images.size(path), size)
+
+    def test_header_size(self):
+        with tempfile.TemporaryDirectory() as directory:
+            image = Img.new("RGB", (123, 45), "red")
+            for name, options in [("image.png", {}),
+                                  ("image.gif", {}),
+                                  ("image.jpg", {}),
+                                  ("progressive.jpg", {"progressive": True}),
+                                  ("exif.jpg", {"exif": Img.Exif().tobytes()})]:
+                path = os.path.join(directory, name)
+                image.save(path, **options)
+                self.assertHeaderSize(path, (123, 45))
+
+    def test_size_fallback(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "image.bmp")
+            Img.new("RGB", (12, 34), "red").save(path)
+            with open(path, "rb") as fh:
+                self.assertIsNone(images.header_size(fh))
+            self.assertEqual(images.size(path), (12, 34))
+
+    def test_size_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            Img.new("RGB", (12, 34), "red").save(os.path.join(directory, "image.png"))
+            cache_path = os.path.join(directory, "cache", "images.json")
+            with images.SizeCache(cache_path) as cache:
+                self.assertEqual(cache.lookup(directory, ["image.png"]), {"image.png": (12, 34)})
+            os.remove(os.path.join(directory, "image.png"))
+            with images.SizeCache(cache_path) as cache:
+                self.assertEqual(cache.lookup(directory, ["image.png"]), {"image.png": (12, 34)})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2021-2024 Jason Morley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import importlib.util
+import os
+import sys
+import tempfile
+import unittest
+import unittest.mock
+
+import cache
+import importers.msn_messenger
+import importers.text_archive
+import model
+import profiling
+
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+spec = importlib.util.spec_from_file_location("chat_history", os.path.join(ROOT_DIRECTORY, "chat-history.py"))
+chat_history = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(chat_history)
+
+# Functions submitted to the import process pool are pickled by reference.
+sys.modules.setdefault("chat_history", chat_history)
+
+SEPARATOR = importers.text_archive.SEPARATOR
+
+ARCHIVE = f"""{SEPARATOR}
+| Session Start: 3 March 2001 |
+| Participants:               |
+|    Bobby Tables (bobby@example.com) |
+|    Inertia (inertia@example.com)    |
+{SEPARATOR}
+[16:43:45] Inertia: Hello
+[16:44:02] Bobby Tables: Hi :-)
+[16:44:02] Bobby Tables: Hi :-)
+{SEPARATOR}
+| Session Start: 4 March 2001 |
+| Participants:               |
+|    Someone Else (someone@example.com) |
+|    Inertia (inertia@example.com)      |
+{SEPARATOR}
+[10:00:00] Someone Else: Who's this?
+"""
+
+LOG = """<?xml version="1.0"?>
+<Log FirstSessionID="1" LastSessionID="1">
+<Message DateTime="2004-01-12T12:00:00.000Z" SessionID="1"><From><User LogonName="bobby@example.com" FriendlyName="Bobby Tables"/></From><To><User FriendlyName="Inertia"/></To><Text>hello</Text></Message>
+<Message DateTime="2004-01-12T12:00:05.000Z" SessionID="1"><From><User LogonName="inertia@example.com" FriendlyName="Inertia"/></From><To><User FriendlyName="Bobby Tables"/></To><Text>reply</Text></Message>
+</Log>
+"""
+
+
+def configured_people():
+    people = model.People()
+    for name, identities, is_primary in [("Jason Morley", ["Jason Morley", "inertia@example.com"], True),
+                                         ("Bobby Tables", ["bobby@example.com"], False)]:
+        person = model.Person(name=name, is_primary=is_primary)
+        person.id = model.stable_id("person", "name", name)
+        for identity in identities:
+            people.people[identity] = person
+    return people
+
+
+def summary(sessions):
+    return [(session.sources,
+             [person.id for person in session.people],
+             [(event.id, event.source, event.type, event.date, event.person.id, event.content)
+              for event in session.events])
+            for session in sessions]
+
+
+class TestImportSources(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        patcher = unittest.mock.patch.object(chat_history, "OUTPUT_ATTACHMENTS_DIRECTORY",
+                                             os.path.join(self.directory.name, "attachments"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.tasks = []
+        for importer, basename, content in [(importers.text_archive, "archive.txt", ARCHIVE),
+                                            (importers.msn_messenger, "Bobby Tables.xml", LOG)]:
+            path = os.path.join(self.directory.name, basename)
+            with open(path, "w") as fh:
+                fh.write(content)
+            self.tasks.append((importer, path))
+
+    def import_sources(self, jobs, import_cache=None):
+        people = configured_people()
+        sessions = list(chat_history.import_sources(self.tasks, people, import_cache, jobs, profiling.Profiler()))
+        return people, sessions
+
+    def test_parallel_import_matches_serial_import(self):
+        serial_people, serial_sessions = self.import_sources(jobs=1)
+        parallel_people, parallel_sessions = self.import_sources(jobs=2)
+        self.assertEqual(len(serial_sessions), 3)
+        self.assertEqual(summary(parallel_sessions), summary(serial_sessions))
+        self.assertEqual(serial_people.people.keys(), parallel_people.people.keys())
+
+        # Imported people are reconciled with the configured people (including the primary person).
+        for people, sessions in [(serial_people, serial_sessions), (parallel_people, parallel_sessions)]:
+            instances = {id(person) for person in people.people.values()}
+            for session in sessions:
+                self.assertIn(people.primary, session.people)
+                for person in session.people:
+                    self.assertIn(id(person), instances)
+                for event in session.events:
+                    self.assertIn(id(event.person), instances)
+            senders = {event.content: event.person for session in sessions for event in session.events}
+            self.assertIs(senders["<p>reply</p>"], people.primary)
+            self.assertIs(senders["<p>hello</p>"], people.people["bobby@example.com"])
+
+    def test_truncated_cache_entries_are_reimported(self):
+        _, expected_sessions = self.import_sources(jobs=1)
+        cache_directory = os.path.join(self.directory.name, "cache")
+        for jobs in [1, 2]:
+            with cache.SessionCache(cache_directory, chat_history.OUTPUT_ATTACHMENTS_DIRECTORY) as import_cache:
+                self.import_sources(jobs, import_cache)
+            for name in os.listdir(cache_directory):
+                path = os.path.join(cache_directory, name, cache.SESSIONS_FILENAME)
+                if os.path.isfile(path):
+                    with open(path, "r+b") as fh:
+                        fh.truncate(os.path.getsize(path) // 2)
+            with cache.SessionCache(cache_directory, chat_history.OUTPUT_ATTACHMENTS_DIRECTORY) as import_cache:
+                with self.assertLogs(level="WARNING"):
+                    _, sessions = self.import_sources(jobs, import_cache)
+                self.assertEqual(import_cache.hits, 0)
+                self.assertEqual(import_cache.misses, len(self.tasks))
+            self.assertEqual(summary(sessions), summary(expected_sessions))
+
+            # The entries are replaced, so the next run uses them.
+            with cache.SessionCache(cache_directory, chat_history.OUTPUT_ATTACHMENTS_DIRECTORY) as import_cache:
+                _, sessions = self.import_sources(jobs, import_cache)
+                self.assertEqual(import_cache.hits, len(self.tasks))
+            self.assertEqual(summary(sessions), summary(expected_sessions))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+# Copyright (c) 2021-2024 Jason Morley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import datetime
+import importlib.util
+import os
+import unittest
+
+import pytz
+
+import model
+
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+spec = importlib.util.spec_from_file_location("chat_history", os.path.join(ROOT_DIRECTORY, "chat-history.py"))
+chat_history = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(chat_history)
+
+
+def message(person, hour, content):
+    return model.Message(type=model.EventType.MESSAGE,
+                         date=datetime.datetime(2022, 6, 29, hour, 0, 0).replace(tzinfo=pytz.utc),
+                         person=person,
+                         content=content)
+
+
+class TestMerge(unittest.TestCase):
+
+    def test_merge_events(self):
+        person = model.Person(name="Person", is_primary=False)
+        a = [message(person, 1, "a1"), message(person, 3, "a3"), message(person, 5, "a5")]
+        b = [message(person, 2, "b2"), message(person, 3, "b3")]
+        c = [message(person, 4, "c4")]
+        events = list(chat_history.merge_events([a, [], b, c]))
+        self.assertEqual([event.content for event in events], ["a1", "b2", "a3", "b3", "c4", "a5"])
+
+    def test_merge_events_mixed_timezones(self):
+        person = model.Person(name="Person", is_primary=False)
+        a = [message(person, 1, "a1")]
+        b = [model.Message(type=model.EventType.MESSAGE,
+                           date=datetime.datetime(2022, 6, 29, 2, 0, 0),
+                           person=person,
+                           content="b2")]
+        with self.assertLogs(level="ERROR"):
+            with self.assertRaises(TypeError):
+                list(chat_history.merge_events([a, b]))
+
+    def test_merge_sessions(self):
+        primary = model.Person(name="Primary", is_primary=True)
+        person = model.Person(name="Person", is_primary=False)
+        a = model.Session(sources=["a"], people=[primary, person], events=[message(person, 2, "a2")])
+        b = model.Session(sources=["b"], people=[person], events=[message(primary, 1, "b1")])
+        session = chat_history.merge_sessions([a, b])
+        self.assertEqual(session.sources, ["a", "b"])
+        self.assertEqual(set(session.people), {primary, person})
+        self.assertEqual([event.content for event in session.events], ["b1", "a2"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2021-2024 Jason Morley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import datetime
+import pickle
+import unittest
+
+import pytz
+
+import model
+
+
+class TestModel(unittest.TestCase):
+
+    def test_identifiers_are_stable(self):
+        person = model.Person(name="Jason", is_primary=True)
+        message = model.Message(type=model.EventType.MESSAGE,
+                                date=datetime.datetime(2022, 6, 29, 15, 25, 18).replace(tzinfo=pytz.utc),
+                                person=person,
+                                content="<p>Hello</p>")
+        self.assertEqual(message.id, message.id)
+        self.assertNotEqual(message.id, person.id)
+
+    def test_events_have_no_dict(self):
+        person = model.Person(name="Jason", is_primary=True)
+        image = model.Image(date=datetime.datetime(2022, 6, 29, 15, 25, 18).replace(tzinfo=pytz.utc),
+                            person=person,
+                            content="photo.jpg",
+                            size=(640, 480))
+        self.assertFalse(hasattr(person, "__dict__"))
+        self.assertFalse(hasattr(image, "__dict__"))
+        self.assertEqual(image.mimetype, "image/jpeg")
+
+    def test_pickle(self):
+        person = model.Person(name="Jason", is_primary=True)
+        video = model.Video(date=datetime.datetime(2022, 6, 29, 15, 25, 18).replace(tzinfo=pytz.utc),
+                            person=person,
+                            content="video.mp4")
+        identifier = video.id
+        copy = pickle.loads(pickle.dumps(video))
+        self.assertEqual(copy.id, identifier)
+        self.assertEqual(copy.type, model.EventType.VIDEO)
+        self.assertEqual(copy.content, "video.mp4")
+        self.assertEqual(copy.person.name, "Jason")
+
+
+if __name__ == '__main__':
+    unittest.main()
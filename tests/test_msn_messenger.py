@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2021-2024 Jason Morley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import datetime
+import os
+import tempfile
+import unittest
+
+import pytz
+
+import importers.msn_messenger
+import model
+
+
+LOG = """<?xml version="1.0"?>
+<Log FirstSessionID="1" LastSessionID="1">
+<Message DateTime="2004-01-12T12:00:00.000Z" SessionID="1"><From><User LogonName="" FriendlyName="Bobby Tables"/></From><To><User FriendlyName="Inertia"/></To><Text Style="font-family:Arial">hello :-)</Text></Message>
+<Message DateTime="2004-01-12T12:00:05.000Z" SessionID="1"><From><User LogonName="inertia@example.com" FriendlyName="Inertia"/></From><To><User FriendlyName="Bobby Tables"/></To><Text Style="font-family:Arial">reply &amp; more</Text></Message>
+<Message DateTime="2004-01-12T12:00:09.000Z" SessionID="1"><From><User LogonName="inertia@example.com" FriendlyName="Inertia"/></From><To><User FriendlyName="Bobby Tables"/></To><Text Style="font-family:Arial">lost</Text></Message>
+</Log>
+"""
+
+
+class TestMSNMessenger(unittest.TestCase):
+
+    def import_messages(self, data):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "bob@example.com.xml")
+            with open(path, "w") as fh:
+                fh.write(data)
+            people = model.People()
+            people.people["inertia@example.com"] = model.Person(name="Inertia", is_primary=True)
+            context = model.ImportContext(people=people)
+            return importers.msn_messenger.import_messages(context, directory, path)
+
+    def test_import_messages(self):
+        sessions = self.import_messages(LOG)
+        self.assertEqual(len(sessions), 1)
+        events = sessions[0].events
+        self.assertEqual([event.date for event in events],
+                         [datetime.datetime(2004, 1, 12, 12, 0, seconds).replace(tzinfo=pytz.utc) for seconds in [0, 5, 9]])
+        self.assertEqual([event.person.name for event in events], ["Bobby Tables", "Inertia", "Inertia"])
+        self.assertEqual(events[0].content, "<p>hello 🙂</p>")
+        self.assertEqual(events[1].content, "<p>reply &amp; more</p>")
+        self.assertEqual({person.name for person in sessions[0].people}, {"Bobby Tables", "Inertia", "bob@example.com"})
+
+    def test_import_truncated_messages(self):
+        with self.assertLogs(level="WARNING"):
+            sessions = self.import_messages(LOG[:LOG.index("lost")])
+        self.assertEqual(len(sessions), 1)
+        self.assertEqual([event.content for event in sessions[0].events], ["<p>hello 🙂</p>", "<p>reply &amp; more</p>"])
+
+    def test_import_invalid_log(self):
+        with self.assertLogs(level="ERROR"):
+            self.assertEqual(self.import_messages(""), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2021-2024 Jason Morley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import json
+import os
+import tempfile
+import unittest
+
+import profiling
+
+
+class TestProfiler(unittest.TestCase):
+
+    def test_stages(self):
+        with tempfile.TemporaryDirectory() as directory:
+            profiler = profiling.Profiler(trace_memory=True, profile_directory=os.path.join(directory, "profiles"))
+            try:
+                with profiler.stage("allocate") as stage:
+                    items = [str(i) for i in range(10000)]
+                    stage.count(items=len(items))
+            finally:
+                profiler.close()
+            path = os.path.join(directory, "stats.json")
+            profiler.write(path)
+            with open(path) as fh:
+                summary = json.load(fh)
+            self.assertTrue(os.path.exists(os.path.join(directory, "profiles", "allocate.prof")))
+        self.assertEqual([stage["name"] for stage in summary["stages"]], ["allocate"])
+        stage = summary["stages"][0]
+        self.assertEqual(stage["counts"], {"items": 10000})
+        self.assertGreater(stage["peak_traced_memory"], 0)
+        self.assertGreaterEqual(stage["wall_time"], 0)
+        self.assertGreaterEqual(stage["rss_high_water_delta"], 0)
+        self.assertNotIn("peak_rss", stage)
+        self.assertGreater(summary["peak_rss"], 0)
+
+    def test_importers(self):
+        profiler = profiling.Profiler()
+        profiler.source(importer="text_archive", path="a.txt", events=10, duration=1.0, is_cached=False)
+        profiler.source(importer="text_archive", path="b.txt", events=30, duration=1.0, is_cached=True)
+        profiler.source(importer="whatsapp_ios", path="c.zip", events=0, duration=0.0, is_cached=False)
+        self.assertEqual(profiler.importers(),
+                         {"text_archive": {"sources": 2, "events": 40, "duration": 2.0, "events_per_second": 20.0},
+                          "whatsapp_ios": {"sources": 1, "events": 0, "duration": 0.0, "events_per_second": None}})
+        self.assertEqual(profiler.sources[0]["events_per_second"], 10.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2021-2024 Jason Morley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import datetime
+import importlib.util
+import json
+import os
+import tempfile
+import unittest
+import unittest.mock
+
+import pytz
+
+import model
+
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+spec = importlib.util.spec_from_file_location("chat_history", os.path.join(ROOT_DIRECTORY, "chat-history.py"))
+chat_history = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(chat_history)
+
+
+def conversation(name, contents):
+    primary = model.Person(name="Jason Morley", is_primary=True)
+    person = model.Person(name=name, is_primary=False)
+    for p in [primary, person]:
+        p.id = model.stable_id("person", "name", p.name)
+    date = datetime.datetime(2022, 6, 29, 15, 25, 18).replace(tzinfo=pytz.utc)
+    events = [model.Message(type=model.EventType.MESSAGE, date=date + datetime.timedelta(minutes=i), person=person, content=content)
+              for i, content in enumerate(contents)]
+    model.identify_events(name, events)
+    return model.Conversation(sources=[name], people=[primary, person], batches=[model.Batch(date=date, person=person, events=events)])
+
+
+class TestRender(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        patcher = unittest.mock.patch.multiple(chat_history,
+                                               OUTPUT_DATA_DIRECTORY=self.directory.name,
+                                               OUTPUT_EXPORT_DIRECTORY=os.path.join(self.directory.name, "conversations"),
+                                               EXPORT_CHUNK_SIZE=10,
+                                               TEMPLATES_CACHE_DIRECTORY=os.path.join(self.directory.name, "cache"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.directory.cleanup)
+        self.manifest_path = os.path.join(self.directory.name, "manifest.json")
+
+    def render(self, conversations):
+        with chat_history.RenderManifest(self.manifest_path) as manifest:
+            return chat_history.render_conversations(conversations, 1, manifest)
+
+    def test_render_conversations_skips_unchanged(self):
+        a = conversation("Pavlos", ["<p>Hello</p>"])
+        b = conversation("Tom", ["<p>Hi</p>"])
+        self.assertEqual(self.render([a, b]), (2, 0))
+        path = os.path.join(self.directory.name, f"{a.id}.html")
+        with open(path) as fh:
+            self.assertIn("<p>Hello</p>", fh.read())
+        self.assertEqual(self.render([a, b]), (0, 2))
+
+        # Changing a conversation only re-renders that conversation.
+        a = conversation("Pavlos", ["<p>Hello</p>", "<p>Again</p>"])
+        self.assertEqual(self.render([a, b]), (1, 1))
+        with open(path) as fh:
+            self.assertIn("<p>Again</p>", fh.read())
+
+    def test_render_conversations_missing_page(self):
+        a = conversation("Pavlos", ["<p>Hello</p>"])
+        self.assertEqual(self.render([a]), (1, 0))
+        os.remove(os.path.join(self.directory.name, f"{a.id}.html"))
+        self.assertEqual(self.render([a]), (1, 0))
+
+    def test_export_conversation(self):
+        a = conversation("Pavlos", [f"<p>Message {i}</p>" for i in range(25)])
+        self.assertEqual(self.render([a]), (1, 0))
+        directory = os.path.join(self.directory.name, "conversations", a.id)
+        with open(os.path.join(directory, "manifest.json")) as fh:
+            manifest = json.load(fh)
+        self.assertEqual(manifest["count"], 25)
+        self.assertEqual(manifest["people"][a.people[1].id], {"name": "Pavlos", "primary": False})
+        self.assertEqual([(chunk["path"], chunk["count"]) for chunk in manifest["chunks"]],
+                         [("00002.json", 5), ("00001.json", 10), ("00000.json", 10)])
+        self.assertEqual(manifest["chunks"][0]["end"], "2022-06-29T15:49:18+00:00")
+        self.assertEqual(manifest["chunks"][2]["start"], "2022-06-29T15:25:18+00:00")
+        for chunk in manifest["chunks"]:
+            path = os.path.join(directory, chunk["path"])
+            self.assertEqual(os.path.getsize(path), chunk["size"])
+        with open(os.path.join(directory, "00002.json")) as fh:
+            events = json.load(fh)
+        self.assertEqual([event["content"] for event in events], [f"<p>Message {i}</p>" for i in range(24, 19, -1)])
+
+        # Postings locate each event by its ordinal in the conversation.
+        with open(os.path.join(directory, "terms.json")) as fh:
+            terms = json.load(fh)
+        self.assertEqual(terms["24"], [[24, 1]])
+        self.assertEqual(len(terms["message"]), 25)
+
+        # Adding events only changes the newest chunk.
+        modified = os.stat(os.path.join(directory, "00000.json")).st_mtime_ns
+        a = conversation("Pavlos", [f"<p>Message {i}</p>" for i in range(26)])
+        self.assertEqual(self.render([a]), (1, 0))
+        self.assertEqual(os.stat(os.path.join(directory, "00000.json")).st_mtime_ns, modified)
+        with open(os.path.join(directory, "00002.json")) as fh:
+            self.assertEqual(len(json.load(fh)), 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
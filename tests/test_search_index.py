@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2021-2024 Jason Morley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+import search_index
+
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIRECTORY = os.path.join(ROOT_DIRECTORY, "tests", "data")
+
+# Tokenizes each text in a JSON list read from stdin with `searchTerms` from `static/js/search.js`.
+JAVASCRIPT_TERMS = """
+const fs = require("fs");
+const vm = require("vm");
+const input = JSON.parse(fs.readFileSync(0, "utf8"));
+vm.runInThisContext(fs.readFileSync(input.script, "utf8"));
+console.log(JSON.stringify(input.texts.map((text) => searchTerms(text, input.folds))));
+"""
+
+
+# Test vectors shared by the Python and JavaScript tokenizers.
+def term_vectors():
+    with open(os.path.join(DATA_DIRECTORY, "search_terms.json"), encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+class TestSearchIndex(unittest.TestCase):
+
+    def test_terms(self):
+        self.assertEqual(search_index.terms("Héllo, WORLD! Straße naïve café_1 Ｆｕｌｌ"),
+                         ["hello", "world", "strasse", "naive", "cafe_1", "full"])
+        self.assertEqual(search_index.terms(""), [])
+
+    def test_terms_vectors(self):
+        for vector in term_vectors():
+            self.assertEqual(search_index.terms(vector["text"]), vector["terms"], vector["text"])
+
+    @unittest.skipUnless(shutil.which("node"), "requires node")
+    def test_javascript_terms_vectors(self):
+        vectors = term_vectors()
+        input = {"script": os.path.join(ROOT_DIRECTORY, "static", "js", "search.js"),
+                 "texts": [vector["text"] for vector in vectors],
+                 "folds": search_index.case_folds()}
+        output = subprocess.run(["node", "-e", JAVASCRIPT_TERMS], input=json.dumps(input), capture_output=True,
+                                text=True, check=True).stdout
+        for vector, terms in zip(vectors, json.loads(output)):
+            self.assertEqual(terms, vector["terms"], vector["text"])
+
+    def test_case_folds(self):
+        folds = search_index.case_folds()
+        self.assertEqual(folds["ß"], "ss")
+        self.assertEqual(folds["ς"], "σ")
+        self.assertNotIn("A", folds)
+
+    def test_shard_key(self):
+        self.assertEqual(search_index.shard_key("hello"), "6865")
+        self.assertEqual(search_index.shard_key("a"), "61")
+        self.assertEqual(search_index.shard_key("été"), "c3a974")
+
+    def test_postings(self):
+        postings = search_index.Postings()
+        postings.add(3, "a b a c a")
+        postings.add(5, "B")
+        self.assertEqual(json.loads(postings.json()), {"a": [[3, 0, 2, 2]], "b": [[3, 1], [5, 0]], "c": [[3, 3]]})
+
+    def test_write_index(self):
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            for index, texts in enumerate([["hello world"], ["help", "world"]]):
+                postings = search_index.Postings()
+                for ordinal, text in enumerate(texts):
+                    postings.add(ordinal, text)
+                path = os.path.join(directory, f"{index}.json")
+                with open(path, "w") as fh:
+                    fh.write(postings.json())
+                paths.append(path)
+            index_directory = os.path.join(directory, "search")
+            os.makedirs(index_directory)
+            stale_path = os.path.join(index_directory, "7a7a.json")
+            with open(stale_path, "w") as fh:
+                fh.write("{}")
+
+            self.assertEqual(search_index.write_index(index_directory, [("a", paths[0]), ("b", paths[1])]), 2)
+            with open(os.path.join(index_directory, search_index.MANIFEST_FILENAME)) as fh:
+                manifest = json.load(fh)
+            self.assertEqual(manifest["folds"], search_index.case_folds())
+            del manifest["folds"]
+            self.assertEqual(manifest, {"prefix_length": 2, "conversations": ["a", "b"], "shards": ["6865", "776f"]})
+            with open(os.path.join(index_directory, "6865.json")) as fh:
+                self.assertEqual(json.load(fh), {"hello": [[0, 0, 0]], "help": [[1, 0, 0]]})
+            with open(os.path.join(index_directory, "776f.json")) as fh:
+                self.assertEqual(json.load(fh), {"world": [[0, 0, 1], [1, 1, 0]]})
+            self.assertFalse(os.path.exists(stale_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2021-2024 Jason Morley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import importlib.util
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+import urllib.error
+import urllib.request
+
+import fixtures
+import store
+
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+spec = importlib.util.spec_from_file_location("chat_history_server", os.path.join(ROOT_DIRECTORY, "chat-history-server.py"))
+chat_history_server = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(chat_history_server)
+
+
+class TestServer(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "messages.sqlite")
+        self.conversation = fixtures.conversation(count=25, source="source.txt")
+        with store.Store(self.path) as database, database.transaction() as transaction:
+            transaction.update(set(self.conversation.people), [self.conversation])
+        self.pool = store.ConnectionPool(self.path, size=2)
+        self.addCleanup(self.pool.close)
+        self.server = chat_history_server.Server(("127.0.0.1", 0), self.pool)
+        self.addCleanup(self.server.server_close)
+        thread = threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.05})
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.shutdown)
+
+    def get(self, path, headers={}):
+        request = urllib.request.Request(f"http://127.0.0.1:{self.server.server_address[1]}{path}", headers=headers)
+        with urllib.request.urlopen(request) as response:
+            return response, json.loads(response.read())
+
+    def test_conversations(self):
+        _, conversations = self.get("/conversations")
+        self.assertEqual(conversations, [{"id": self.conversation.id, "name": "Pavlos Vinieratos"}])
+        _, people = self.get("/people")
+        self.assertEqual([person["name"] for person in people], ["Jason Morley", "Pavlos Vinieratos"])
+
+    def test_events(self):
+        contents = []
+        path = f"/conversations/{self.conversation.id}/events?limit=10"
+        while True:
+            _, page = self.get(path)
+            self.assertLessEqual(len(page["events"]), 10)
+            contents.extend(event["content"] for event in page["events"])
+            if page["next"] is None:
+                break
+            path = f"/conversations/{self.conversation.id}/events?limit=10&before={page['next']}"
+        self.assertEqual(len(contents), 25)
+        self.assertEqual(set(contents), {f"<p>Message {i}</p>" for i in range(25)})
+        self.assertEqual(contents[0], "<p>Message 24</p>")
+
+    def test_not_modified(self):
+        response, _ = self.get("/conversations")
+        etag = response.headers["ETag"]
+        self.assertIsNotNone(response.headers["Last-Modified"])
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            self.get("/conversations", headers={"If-None-Match": etag})
+        self.assertEqual(context.exception.code, 304)
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            self.get("/conversations", headers={"If-Modified-Since": response.headers["Last-Modified"]})
+        self.assertEqual(context.exception.code, 304)
+        response, _ = self.get("/people")
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+    def test_search(self):
+        _, results = self.get("/search?q=message&limit=5")
+        self.assertEqual(len(results), 5)
+        self.assertEqual(results[0]["conversation"], self.conversation.id)
+
+    def test_errors(self):
+        for path, code in [("/unknown", 404),
+                           ("/conversations/unknown/events", 404),
+                           (f"/conversations/{self.conversation.id}/events?limit=0", 400),
+                           (f"/conversations/{self.conversation.id}/events?before=invalid", 400),
+                           ("/search", 400),
+                           ("/search?q=%22", 400)]:
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                self.get(path)
+            self.assertEqual(context.exception.code, code, path)
+
+    def test_invalid_parameters(self):
+        for position in [None, 5, "cursor", {}, [], ["2001-03-03T16:43:45+00:00"], ["2001-03-03T16:43:45+00:00", 1],
+                         [None, "id"], ["2001-03-03T16:43:45+00:00", "id", "extra"]]:
+            cursor = chat_history_server.encode_cursor(position)
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                self.get(f"/conversations/{self.conversation.id}/events?before={cursor}")
+            self.assertEqual(context.exception.code, 400, position)
+            self.assertEqual(json.loads(context.exception.read()), {"error": f"Invalid cursor '{cursor}'."})
+        for path, message in [("/search?q=message&offset=-1", "offset must be at least 0."),
+                              ("/search?q=message&limit=0", "limit must be between 1 and 1000.")]:
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                self.get(path)
+            self.assertEqual(context.exception.code, 400, path)
+            self.assertEqual(json.loads(context.exception.read()), {"error": message})
+
+    def test_conditional_requests_are_validated(self):
+        since = "Fri, 01 Jan 2100 00:00:00 GMT"
+        for path, code in [("/unknown", 404),
+                           ("/conversations/unknown/events", 404),
+                           (f"/conversations/{self.conversation.id}/events?limit=0", 400),
+                           ("/search", 400),
+                           ("/conversations", 304)]:
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                self.get(path, headers={"If-Modified-Since": since})
+            self.assertEqual(context.exception.code, code, path)
+
+    def test_internal_server_error(self):
+        with sqlite3.connect(self.path) as connection:
+            connection.execute("ALTER TABLE people RENAME TO people_renamed")
+        with self.assertLogs(level="ERROR"):
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                self.get("/people")
+        self.assertEqual(context.exception.code, 500)
+        self.assertEqual(json.loads(context.exception.read()), {"error": "Internal server error."})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+# Copyright (c) 2021-2024 Jason Morley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import tempfile
+import unittest
+
+import fixtures
+import model
+import store
+
+
+class TestStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "messages.sqlite")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def load(self, database, conversations):
+        with database.bulk_load(), database.transaction() as transaction:
+            transaction.CHUNK_SIZE = 10
+            transaction.add_people({person for c in conversations for person in c.people})
+            transaction.add_conversations(conversations)
+            return transaction.add_events((event, c) for c in conversations for batch in c.batches for event in batch.events)
+
+    def test_bulk_load(self):
+        c = fixtures.conversation(count=25)
+        with store.Store(self.path) as database:
+            self.assertEqual(self.load(database, [c]), 25)
+            cursor = database.connection.cursor()
+            self.assertEqual(cursor.execute("SELECT COUNT(*) FROM events").fetchone()[0], 25)
+            self.assertEqual(cursor.execute("SELECT COUNT(*) FROM people").fetchone()[0], 2)
+            self.assertEqual(cursor.execute("PRAGMA journal_mode").fetchone()[0], "delete")
+            self.assertEqual(cursor.execute("PRAGMA synchronous").fetchone()[0], 2)
+            indexes = {row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+            self.assertTrue(set(store.INDEXES.keys()).issubset(indexes))
+
+    def test_search(self):
+        a = fixtures.conversation(count=5)
+        b = fixtures.conversation(count=5)
+        events = a.batches[0].events
+        events[1].content = "<p>Happy birthday &amp; caf\u00e9!</p><p>See <a href=\"https://example.com\">https://example.com</a></p>"
+        events[3].content = "<p>Birthday cake</p>"
+        with store.Store(self.path) as database:
+            self.load(database, [a, b])
+            results = database.search("birthday")
+            self.assertEqual({result.event for result in results}, {events[1].id, events[3].id})
+            self.assertEqual(results[0].event, events[3].id)
+            self.assertEqual(results[0].snippet, "<mark>Birthday</mark> cake")
+            self.assertEqual([result.event for result in database.search("cafe example")], [events[1].id])
+            self.assertEqual(len(database.search("message")), 8)
+            self.assertEqual(len(database.search("message", conversation=b.id)), 5)
+            self.assertEqual(len(database.search("message", limit=2)), 2)
+            self.assertEqual(len(database.search("message", offset=6)), 2)
+            self.assertEqual(database.search("href"), [])
+
+    def test_update(self):
+        a = fixtures.conversation(count=6)
+        b = fixtures.conversation(count=4)
+        model.identify_events("a.txt", a.batches[0].events)
+        model.identify_events("b.txt", b.batches[0].events)
+        people = {person for c in [a, b] for person in c.people}
+        with store.Store(self.path) as database:
+            with database.transaction() as transaction:
+                self.assertEqual(transaction.update(people, [a, b]), (2, 2, 10, 0))
+            with database.transaction() as transaction:
+                self.assertEqual(transaction.update(people, [a, b]), (2, 0, 0, 0))
+
+            # Replace a message in one source, and remove the other.
+            a.batches[0].events[5] = model.Message(type=model.EventType.MESSAGE,
+                                                   date=a.batches[0].events[5].date,
+                                                   person=a.batches[0].events[5].person,
+                                                   content="<p>Edited</p>")
+            model.identify_events("a.txt", a.batches[0].events)
+            with database.transaction() as transaction:
+                self.assertEqual(transaction.update(set(a.people), [a]), (1, 1, 1, 5))
+
+            cursor = database.connection.cursor()
+            self.assertEqual(cursor.execute("SELECT COUNT(*) FROM events").fetchone()[0], 6)
+            self.assertEqual(cursor.execute("SELECT COUNT(*) FROM people").fetchone()[0], 2)
+            self.assertEqual(cursor.execute("SELECT COUNT(*) FROM conversations").fetchone()[0], 1)
+            self.assertEqual(len(database.search("message")), 5)
+            self.assertEqual([result.event for result in database.search("edited")], [a.batches[0].events[5].id])
+
+    def test_search_index_is_keyed_by_event(self):
+        # Identifiers which share a prefix (and so would collide if search rows were keyed by a hash of them).
+        c = fixtures.conversation(count=3)
+        for index, event in enumerate(c.batches[0].events):
+            event.identify("a.txt", f"00000000-0000-0000-0000-00000000000{index}")
+        with store.Store(self.path) as database:
+            with database.transaction() as transaction:
+                self.assertEqual(transaction.update(set(c.people), [c]), (1, 1, 3, 0))
+            self.assertEqual(len(database.search("message")), 3)
+            del c.batches[0].events[1]
+            with database.transaction() as transaction:
+                self.assertEqual(transaction.update(set(c.people), [c]), (1, 1, 0, 1))
+            database.connection.execute("VACUUM")
+            self.assertEqual({result.event for result in database.search("message")},
+                             {event.id for event in c.batches[0].events})
+            database.connection.execute("INSERT INTO events_search (events_search, rank) VALUES ('integrity-check', 1)")
+
+    def test_identifiers_are_deterministic(self):
+        events = [fixtures.conversation(count=3).batches[0].events for _ in range(2)]
+        for e in events:
+            for event in e:
+                event.person.id = model.stable_id("person", "name", event.person.name)
+            model.identify_events("a.txt", e)
+        self.assertEqual([event.id for event in events[0]], [event.id for event in events[1]])
+        self.assertEqual(len({event.id for event in events[0]}), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
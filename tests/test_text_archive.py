@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2021-2024 Jason Morley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import datetime
+import json
+import os
+import tempfile
+import unittest
+
+import pytz
+
+import importers.text_archive
+import model
+
+
+DATA_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+SEPARATOR = importers.text_archive.SEPARATOR
+
+SESSION = f"""{SEPARATOR}
+| Session Start: 3 March 2001 |
+| Participants:               |
+|    ...the long one (long@example.com) |
+|    Inertia (inertia@example.com)      |
+
+{SEPARATOR}
+[16:43:45] Inertia: Hello
+        there
+[16:44:02] long one: It's (H)
+"""
+
+MALFORMED_SESSION = f"""{SEPARATOR}
+| Session Start: 4 March 2001 |
+| Not participants |
+{SEPARATOR}
+[10:00:00] Inertia: Lost
+"""
+
+
+class TestTextArchive(unittest.TestCase):
+
+    def import_path(self, directory, path):
+        people = model.People()
+        people.people["inertia@example.com"] = model.Person(name="Inertia", is_primary=True)
+        context = model.ImportContext(people=people)
+        return importers.text_archive.import_messages(context, directory, path)
+
+    def import_messages(self, text, encoding="utf-8"):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "archive.txt")
+            with open(path, "w", encoding=encoding, newline="") as fh:
+                fh.write(text)
+            return self.import_path(directory, path)
+
+    def test_parse_sessions(self):
+        sessions = list(importers.text_archive.parse_sessions(SESSION.splitlines()))
+        self.assertEqual(len(sessions), 1)
+        session = sessions[0]
+        self.assertEqual(session.start, "3 March 2001")
+        self.assertEqual([participant["email"] for participant in session.participants],
+                         ["long@example.com", "inertia@example.com"])
+        self.assertEqual([(message["user"], message["content"]) for message in session.messages],
+                         [("Inertia", "Hello there"), ("long one", "It's (H)")])
+
+    def test_import_messages(self):
+        sessions = self.import_messages(SESSION.replace("\n", "\r\n"), encoding="utf-16")
+        self.assertEqual(len(sessions), 1)
+        events = sessions[0].events
+        self.assertEqual(len(events), 2)
+        self.assertEqual(events[0].date, datetime.datetime(2001, 3, 3, 16, 43, 45).replace(tzinfo=pytz.utc))
+        self.assertTrue(events[0].person.is_primary)
+        self.assertEqual(events[0].content, "<p>Hello there</p>")
+        self.assertEqual(events[1].person.name, "long@example.com")
+        self.assertEqual(events[1].content, "<p>It&#x27;s 😎</p>")
+
+    def test_import_messages_matches_pyparsing_grammar(self):
+        # The expected sessions were generated by the pyparsing grammar this parser replaced. People are sorted, as
+        # that implementation didn't preserve their order.
+        with open(os.path.join(DATA_DIRECTORY, "text_archive.json"), encoding="utf-8") as fh:
+            expected = json.load(fh)
+        with tempfile.TemporaryDirectory() as directory:
+            sessions = self.import_path(directory, os.path.join(DATA_DIRECTORY, "text_archive.txt"))
+        self.assertEqual([{"people": sorted(person.name for person in session.people),
+                           "events": [[event.date.isoformat(), event.person.name, event.content]
+                                      for event in session.events]}
+                          for session in sessions],
+                         expected)
+
+    def test_participant_map_lookup(self):
+        participant_map = importers.text_archive.ParticipantMap(participants=[
+            {"name": "Bob Smith ", "email": "bob@example.com"},
+            {"name": "...the long one", "email": "long@example.com"},
+        ])
+        self.assertEqual(participant_map.lookup("Bob Smith"), "bob@example.com")
+        self.assertEqual(participant_map.lookup("Bob Sm.."), "bob@example.com")
+        self.assertEqual(participant_map.lookup("long one"), "long@example.com")
+        self.assertEqual(participant_map.lookup("...the long"), "long@example.com")
+        self.assertEqual(participant_map.lookup("Al"), "long@example.com")
+
+    def test_participant_map_lookup_missing(self):
+        participant_map = importers.text_archive.ParticipantMap(participants=[
+            {"name": "Bob Smith", "email": "bob@example.com"},
+        ])
+        for _ in range(2):
+            with self.assertRaises(KeyError):
+                participant_map.lookup("Al")
+
+    def test_malformed_session_is_skipped(self):
+        with self.assertLogs(level="WARNING"):
+            sessions = self.import_messages(MALFORMED_SESSION + SESSION)
+        self.assertEqual(len(sessions), 1)
+        self.assertEqual(sessions[0].events[0].content, "<p>Hello there</p>")
+
+    def test_username_does_not_continue_onto_next_message(self):
+        session = SESSION.replace("[16:44:02] long one: It's (H)\n",
+                                  "[10:00:00] Bob has left the conversation\n[10:00:01] Bob: hi\n")
+        sessions = list(importers.text_archive.parse_sessions(session.splitlines()))
+        self.assertEqual(len(sessions), 1)
+        self.assertIsInstance(sessions[0], importers.text_archive.ParseError)
+
+    def test_multiline_username(self):
+        session = SESSION.replace("[16:44:02] long one: It's (H)\n",
+                                  "[16:44:02] The following message could not be delivered\nto all recipients: Lost\n")
+        sessions = list(importers.text_archive.parse_sessions(session.splitlines()))
+        self.assertEqual([(message["user"], message["content"]) for message in sessions[0].messages],
+                         [("Inertia", "Hello there"),
+                          ("The following message could not be delivered\nto all recipients", "Lost")])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,178 @@
+# Copyright (c) 2021-2024 Jason Morley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import datetime
+import html
+import io
+import os
+import random
+import sys
+import tempfile
+import unicodedata
+import unittest
+import unittest.mock
+
+import pytz
+
+import utilities
+
+
+# The original implementation, which matches `URL_EXPRESSION` against the entire message.
+def text_to_html_reference(content):
+    content = html.escape(content)
+    content = utilities.URL_EXPRESSION.sub(utilities.link, content)
+    return "".join([f"<p>{line}</p>" for line in content.split("\n")])
+
+
+EXAMPLES = [
+    "",
+    "No links here.",
+    "Multiple\nlines\n\nof text",
+    "See https://example.com/path?query=1&other=2#fragment for details",
+    "http://example.com, (http://example.com/(nested)) and <https://example.com>.",
+    "HTTPS://EXAMPLE.COM/UPPER and Www.Example.Co.Uk",
+    "www.example.com/path.",
+    "example.com example.community example.co.uk/ example.comics",
+    "mailto:someone@example.com and someone@example.com",
+    "http:example and https:%20encoded",
+    "ftp://example.org/file.txt",
+    "Numbers 1.5 and 3.14159 and v1.2.3",
+    "Trailing punctuation: example.org! example.org? \"example.org\" 'example.org'",
+    "Tabs\tand non-breaking spaces example.net example.io",
+    "Non-ASCII café.com münchen.de/straße http://例子.测试 Kexample.uK",
+    "Underscores a_b.com and a.b_c and _.com",
+    "Hyphens -example-.com and ex--ample.org",
+    "End of sentence.Start of next sentence.",
+    "IP 192.168.0.1 and example.com:8080/path",
+    "Brackets [example.com] {example.com} (example.com)",
+]
+
+
+class TestUtilities(unittest.TestCase):
+
+    def test_remove_control_characters(self):
+        self.assertEqual(utilities.remove_control_characters("\u200e[29/06/2022, 15:25:18] Jason:\xa0hey\r\n"),
+                         "[29/06/2022, 15:25:18] Jason: hey")
+        for codepoint in range(0, sys.maxunicode + 1, 7):
+            character = chr(codepoint)
+            expected = "" if unicodedata.category(character)[0] == "C" else character.replace("\xa0", " ")
+            self.assertEqual(utilities.remove_control_characters(character), expected, hex(codepoint))
+
+    def test_is_emoji(self):
+        for content in ["🙂", " 👍🏻 ", "❤️", "🇬🇧", "🙂🙂"]:
+            self.assertTrue(utilities.is_emoji(content), content)
+        for content in ["a", "ok", "🙂 a", "🙂🙂🙂🙂", "hello 🙂"]:
+            self.assertFalse(utilities.is_emoji(content), content)
+
+    def test_text_to_html(self):
+        self.assertEqual(utilities.text_to_html("hey hey"), "<p>hey hey</p>")
+        self.assertEqual(utilities.text_to_html("see example.com"),
+                         "<p>see <a href=\"example.com\" target=\"_blank\">example.com</a></p>")
+
+    def test_date_parser(self):
+        parser = utilities.DateParser(date_formats=["%d %B %Y"], separator=" ")
+        self.assertEqual(parser.parse("12 January 2004 12:01:02"),
+                         datetime.datetime(2004, 1, 12, 12, 1, 2, tzinfo=pytz.utc))
+        self.assertEqual(parser.parse("12 January 2004 9:01:02"),
+                         datetime.datetime(2004, 1, 12, 9, 1, 2, tzinfo=pytz.utc))
+        self.assertEqual(parser.dates, {"12 January 2004": datetime.date(2004, 1, 12)})
+
+        # Unexpected formats fall back to dateutil.
+        self.assertEqual(parser.parse("2004-01-12 12:01:02"),
+                         datetime.datetime(2004, 1, 12, 12, 1, 2, tzinfo=pytz.utc))
+        self.assertEqual(parser.parse("12 January 2004 12:01"),
+                         datetime.datetime(2004, 1, 12, 12, 1, 0, tzinfo=pytz.utc))
+
+    def test_iso_date_parser(self):
+        parser = utilities.ISODateParser()
+        for string in ["2004-01-12T12:00:05.000Z", "2004-01-12T12:00:05+00:00", "2004-01-12T12:00:05"]:
+            self.assertEqual(parser.parse(string), datetime.datetime(2004, 1, 12, 12, 0, 5, tzinfo=pytz.utc))
+        self.assertEqual(parser.parse("2004-01-12T13:00:05+01:00"), utilities.parse_date("2004-01-12T13:00:05+01:00"))
+
+    def test_contains_url_candidate(self):
+        self.assertFalse(utilities.contains_url_candidate("No links here."))
+        self.assertFalse(utilities.contains_url_candidate("Numbers 1.5 and v1.2.3: 🙂"))
+        self.assertTrue(utilities.contains_url_candidate("HTTP:example"))
+        self.assertTrue(utilities.contains_url_candidate("example.COM"))
+        self.assertTrue(utilities.contains_url_candidate("example.uſ"))
+
+    def test_text_to_html_matches_reference(self):
+        for example in EXAMPLES:
+            self.assertEqual(utilities.text_to_html(example), text_to_html_reference(example), example)
+
+    def test_text_to_html_matches_reference_random(self):
+        fragments = ["http", "https", "://", ":", "/", ".", "www", "com", "co", "uk", "example", "@", "(", ")", " ",
+                     "\n", "-", "_", "1", "&", "'", "é", " ", "?", "!", ",", "org", "io", "K", "ſ"]
+        generator = random.Random(42)
+        for _ in range(2000):
+            example = "".join(generator.choice(fragments) for _ in range(generator.randint(0, 20)))
+            self.assertEqual(utilities.text_to_html(example), text_to_html_reference(example), repr(example))
+
+
+class FailingReader(io.BytesIO):
+
+    def read(self, size=-1):
+        raise OSError("Bad archive member.")
+
+
+class TestAttachments(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.source = os.path.join(self.directory.name, "source.txt")
+        with open(self.source, "wb") as fh:
+            fh.write(b"contents")
+        self.destination = os.path.join(self.directory.name, "attachments")
+        os.makedirs(self.destination)
+
+    def test_place_file_without_fcntl(self):
+        with unittest.mock.patch.dict(sys.modules, {"fcntl": None}):
+            with self.assertRaises(OSError):
+                utilities.clone_file(self.source, os.path.join(self.destination, "clone.txt"))
+            utilities.place_file(self.source, os.path.join(self.destination, "placed.txt"))
+        with open(os.path.join(self.destination, "placed.txt"), "rb") as fh:
+            self.assertEqual(fh.read(), b"contents")
+        self.assertEqual(os.listdir(self.destination), ["placed.txt"])
+
+    def test_place_file_failure_removes_temporary_file(self):
+        with unittest.mock.patch.object(os, "replace", side_effect=OSError("Unable to rename.")):
+            with self.assertRaises(OSError):
+                utilities.place_file(self.source, os.path.join(self.destination, "placed.txt"))
+        self.assertEqual(os.listdir(self.destination), [])
+
+    def test_add_attachment_stream(self):
+        basename = utilities.add_attachment_stream(self.destination, io.BytesIO(b"contents"), "Photo.JPG")
+        self.assertTrue(basename.endswith(".jpg"))
+        self.assertEqual(utilities.add_attachment_stream(self.destination, io.BytesIO(b"contents"), "photo.jpg"),
+                         basename)
+        self.assertEqual(os.listdir(self.destination), [basename])
+
+    def test_add_attachment_stream_failure_removes_temporary_file(self):
+        with self.assertRaises(OSError):
+            utilities.add_attachment_stream(self.destination, FailingReader(), "photo.jpg")
+        with unittest.mock.patch.object(os, "replace", side_effect=OSError("Unable to rename.")):
+            with self.assertRaises(OSError):
+                utilities.add_attachment_stream(self.destination, io.BytesIO(b"contents"), "photo.jpg")
+        self.assertEqual(os.listdir(self.destination), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
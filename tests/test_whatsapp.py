@@ -21,7 +21,11 @@
 # SOFTWARE.
 
 import datetime
+import hashlib
+import os
+import tempfile
 import unittest
+import zipfile
 
 import pytz
 
@@ -29,6 +33,9 @@ import importers.whatsapp_ios
 import model
 
 
+DATA_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
 class TestWhatsApp(unittest.TestCase):
 
     def test_parse_message(self):
@@ -49,6 +56,35 @@ class TestWhatsApp(unittest.TestCase):
         self.assertEqual(message.date, datetime.datetime(2022, 6, 29, 17, 26, 11).replace(tzinfo=pytz.utc))
         self.assertEqual(message.content, "<p>Swwwwweeeeeeet.</p>")
 
+    def test_parse_message_day_first(self):
+        context = model.ImportContext(people=model.People())
+        messages = importers.whatsapp_ios.parse_messages(context, ".", ["[05/06/2022, 09:01:02] Jason Morley: Morning"])
+        messages = list(messages)
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0].date, datetime.datetime(2022, 6, 5, 9, 1, 2).replace(tzinfo=pytz.utc))
+
+    def test_import_messages(self):
+        people = model.People()
+        people.people["Jason Barrie Morley"] = model.Person(name="Jason Morley", is_primary=True)
+        context = model.ImportContext(people=people)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "WhatsApp Chat.zip")
+            with zipfile.ZipFile(path, "w") as archive:
+                archive.write(os.path.join(DATA_DIRECTORY, "example.txt"), "_chat.txt")
+                archive.writestr("00000090-PHOTO-2018-01-31-20-27-12.jpg", b"photo")
+                archive.writestr("00000091-PHOTO-2018-01-31-20-27-13.jpg", b"unreferenced")
+            attachments_directory = os.path.join(directory, "attachments")
+            os.makedirs(attachments_directory)
+            sessions = importers.whatsapp_ios.import_messages(context, attachments_directory, path)
+            self.assertEqual(len(sessions), 1)
+            events = sessions[0].events
+            self.assertEqual([event.type for event in events],
+                             [model.EventType.MESSAGE, model.EventType.ATTACHMENT, model.EventType.MESSAGE])
+            self.assertEqual(events[1].content, hashlib.sha256(b"photo").hexdigest() + ".jpg")
+            self.assertEqual(os.listdir(attachments_directory), [events[1].content])
+            with open(os.path.join(attachments_directory, events[1].content), "rb") as fh:
+                self.assertEqual(fh.read(), b"photo")
+
 
 if __name__ == '__main__':
     unittest.main()
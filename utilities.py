@@ -20,9 +20,11 @@
 
 import contextlib
 import datetime
+import errno
 import fnmatch
 import functools
 import glob as g
+import hashlib
 import html
 import logging
 import operator
@@ -32,7 +34,6 @@ import shutil
 import tempfile
 import unicodedata
 import uuid
-import zipfile
 
 import braceexpand
 import dateutil.parser
@@ -42,7 +43,40 @@ import pytz
 import model
 
 
-URL_EXPRESSION = re.compile(r"(?i)\b((?:https?:(?:/{1,3}|[a-z0-9%])|[a-z0-9.\-]+[.](?:com|net|org|edu|gov|mil|aero|asia|biz|cat|coop|info|int|jobs|mobi|museum|name|post|pro|tel|travel|xxx|ac|ad|ae|af|ag|ai|al|am|an|ao|aq|ar|as|at|au|aw|ax|az|ba|bb|bd|be|bf|bg|bh|bi|bj|bm|bn|bo|br|bs|bt|bv|bw|by|bz|ca|cc|cd|cf|cg|ch|ci|ck|cl|cm|cn|co|cr|cs|cu|cv|cx|cy|cz|dd|de|dj|dk|dm|do|dz|ec|ee|eg|eh|er|es|et|eu|fi|fj|fk|fm|fo|fr|ga|gb|gd|ge|gf|gg|gh|gi|gl|gm|gn|gp|gq|gr|gs|gt|gu|gw|gy|hk|hm|hn|hr|ht|hu|id|ie|il|im|in|io|iq|ir|is|it|je|jm|jo|jp|ke|kg|kh|ki|km|kn|kp|kr|kw|ky|kz|la|lb|lc|li|lk|lr|ls|lt|lu|lv|ly|ma|mc|md|me|mg|mh|mk|ml|mm|mn|mo|mp|mq|mr|ms|mt|mu|mv|mw|mx|my|mz|na|nc|ne|nf|ng|ni|nl|no|np|nr|nu|nz|om|pa|pe|pf|pg|ph|pk|pl|pm|pn|pr|ps|pt|pw|py|qa|re|ro|rs|ru|rw|sa|sb|sc|sd|se|sg|sh|si|sj|Ja|sk|sl|sm|sn|so|sr|ss|st|su|sv|sx|sy|sz|tc|td|tf|tg|th|tj|tk|tl|tm|tn|to|tp|tr|tt|tv|tw|tz|ua|ug|uk|us|uy|uz|va|vc|ve|vg|vi|vn|vu|wf|ws|ye|yt|yu|za|zm|zw)/)(?:[^\s()<>{}\[\]]+|\([^\s()]*?\([^\s()]+\)[^\s()]*?\)|\([^\s]+?\))+(?:\([^\s()]*?\([^\s()]+\)[^\s()]*?\)|\([^\s]+?\)|[^\s`!()\[\]{};:'\".,<>?«»“”‘’])|(?:(?<!@)[a-z0-9]+(?:[.\-][a-z0-9]+)*[.](?:com|net|org|edu|gov|mil|aero|asia|biz|cat|coop|info|int|jobs|mobi|museum|name|post|pro|tel|travel|xxx|ac|ad|ae|af|ag|ai|al|am|an|ao|aq|ar|as|at|au|aw|ax|az|ba|bb|bd|be|bf|bg|bh|bi|bj|bm|bn|bo|br|bs|bt|bv|bw|by|bz|ca|cc|cd|cf|cg|ch|ci|ck|cl|cm|cn|co|cr|cs|cu|cv|cx|cy|cz|dd|de|dj|dk|dm|do|dz|ec|ee|eg|eh|er|es|et|eu|fi|fj|fk|fm|fo|fr|ga|gb|gd|ge|gf|gg|gh|gi|gl|gm|gn|gp|gq|gr|gs|gt|gu|gw|gy|hk|hm|hn|hr|ht|hu|id|ie|il|im|in|io|iq|ir|is|it|je|jm|jo|jp|ke|kg|kh|ki|km|kn|kp|kr|kw|ky|kz|la|lb|lc|li|lk|lr|ls|lt|lu|lv|ly|ma|mc|md|me|mg|mh|mk|ml|mm|mn|mo|mp|mq|mr|ms|mt|mu|mv|mw|mx|my|mz|na|nc|ne|nf|ng|ni|nl|no|np|nr|nu|nz|om|pa|pe|pf|pg|ph|pk|pl|pm|pn|pr|ps|pt|pw|py|qa|re|ro|rs|ru|rw|sa|sb|sc|sd|se|sg|sh|si|sj|Ja|sk|sl|sm|sn|so|sr|ss|st|su|sv|sx|sy|sz|tc|td|tf|tg|th|tj|tk|tl|tm|tn|to|tp|tr|tt|tv|tw|tz|ua|ug|uk|us|uy|uz|va|vc|ve|vg|vi|vn|vu|wf|ws|ye|yt|yu|za|zm|zw)\b/?(?!@)))")
+# Top-level domains recognised by `URL_EXPRESSION` (in order).
+TOP_LEVEL_DOMAINS = [
+    "com", "net", "org", "edu", "gov", "mil", "aero", "asia", "biz", "cat", "coop", "info", "int", "jobs", "mobi",
+    "museum", "name", "post", "pro", "tel", "travel", "xxx", "ac", "ad", "ae", "af", "ag", "ai", "al", "am", "an",
+    "ao", "aq", "ar", "as", "at", "au", "aw", "ax", "az", "ba", "bb", "bd", "be", "bf", "bg", "bh", "bi", "bj", "bm",
+    "bn", "bo", "br", "bs", "bt", "bv", "bw", "by", "bz", "ca", "cc", "cd", "cf", "cg", "ch", "ci", "ck", "cl", "cm",
+    "cn", "co", "cr", "cs", "cu", "cv", "cx", "cy", "cz", "dd", "de", "dj", "dk", "dm", "do", "dz", "ec", "ee", "eg",
+    "eh", "er", "es", "et", "eu", "fi", "fj", "fk", "fm", "fo", "fr", "ga", "gb", "gd", "ge", "gf", "gg", "gh", "gi",
+    "gl", "gm", "gn", "gp", "gq", "gr", "gs", "gt", "gu", "gw", "gy", "hk", "hm", "hn", "hr", "ht", "hu", "id", "ie",
+    "il", "im", "in", "io", "iq", "ir", "is", "it", "je", "jm", "jo", "jp", "ke", "kg", "kh", "ki", "km", "kn", "kp",
+    "kr", "kw", "ky", "kz", "la", "lb", "lc", "li", "lk", "lr", "ls", "lt", "lu", "lv", "ly", "ma", "mc", "md", "me",
+    "mg", "mh", "mk", "ml", "mm", "mn", "mo", "mp", "mq", "mr", "ms", "mt", "mu", "mv", "mw", "mx", "my", "mz", "na",
+    "nc", "ne", "nf", "ng", "ni", "nl", "no", "np", "nr", "nu", "nz", "om", "pa", "pe", "pf", "pg", "ph", "pk", "pl",
+    "pm", "pn", "pr", "ps", "pt", "pw", "py", "qa", "re", "ro", "rs", "ru", "rw", "sa", "sb", "sc", "sd", "se", "sg",
+    "sh", "si", "sj", "Ja", "sk", "sl", "sm", "sn", "so", "sr", "ss", "st", "su", "sv", "sx", "sy", "sz", "tc", "td",
+    "tf", "tg", "th", "tj", "tk", "tl", "tm", "tn", "to", "tp", "tr", "tt", "tv", "tw", "tz", "ua", "ug", "uk", "us",
+    "uy", "uz", "va", "vc", "ve", "vg", "vi", "vn", "vu", "wf", "ws", "ye", "yt", "yu", "za", "zm", "zw"
+]
+
+URL_EXPRESSION = re.compile(r"(?i)\b((?:https?:(?:/{1,3}|[a-z0-9%])|[a-z0-9.\-]+[.](?:{TLDS})/)(?:[^\s()<>{}\[\]]+|\([^\s()]*?\([^\s()]+\)[^\s()]*?\)|\([^\s]+?\))+(?:\([^\s()]*?\([^\s()]+\)[^\s()]*?\)|\([^\s]+?\)|[^\s`!()\[\]{};:'\".,<>?«»“”‘’])|(?:(?<!@)[a-z0-9]+(?:[.\-][a-z0-9]+)*[.](?:{TLDS})\b/?(?!@)))"
+                            .replace("{TLDS}", "|".join(TOP_LEVEL_DOMAINS)))
+
+# Lower-cased top-level domains for quickly finding text that might contain URLs.
+TOP_LEVEL_DOMAIN_SET = frozenset(domain.lower() for domain in TOP_LEVEL_DOMAINS)
+
+DOMAIN_SUFFIX_EXPRESSION = re.compile(r"\.(\w+)")
+
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+ATTACHMENT_MODE = 0o644
+
+# Linux `ioctl` for creating copy-on-write clones of files.
+FICLONE = 0x40049409
 
 
 @contextlib.contextmanager
@@ -55,46 +89,104 @@ def chdir(path):
         os.chdir(pwd)
 
 
-@contextlib.contextmanager
-def unzip(path):
-    with tempfile.TemporaryDirectory() as temporary_directory:
-        with zipfile.ZipFile(path, 'r') as zh:
-            zh.extractall(temporary_directory)
-        try:
-            yield temporary_directory
-        finally:
-            pass
-
-
 def glob(path, pattern, *options):
     if path is not None:
         pattern = os.path.join(path, pattern)
     return functools.reduce(operator.concat, [g.glob(p) for p in braceexpand.braceexpand(pattern)], [])
 
 
+def is_control_character(character):
+    return unicodedata.category(character)[0] == "C"
+
+
+# Translation table which removes control characters (Unicode category "C*") and replaces non-breaking spaces with
+# spaces. Characters in the Basic Multilingual Plane are classified up-front; others are classified on first use.
+class ControlCharacterTable(dict):
+
+    def __init__(self):
+        super().__init__()
+        for codepoint in range(0x10000):
+            if is_control_character(chr(codepoint)):
+                self[codepoint] = None
+        self[0xa0] = " "
+
+    def __missing__(self, codepoint):
+        value = None if is_control_character(chr(codepoint)) else codepoint
+        self[codepoint] = value
+        return value
+
+
+CONTROL_CHARACTER_TABLE = ControlCharacterTable()
+
+
 # https://stackoverflow.com/questions/4324790/removing-control-characters-from-a-string-in-python
 def remove_control_characters(s):
-    s = "".join(ch for ch in s if unicodedata.category(ch)[0] != "C")
-    return s.replace("\xa0", " ")
+    return s.translate(CONTROL_CHARACTER_TABLE)
 
 
+# Short messages consisting only of emoji (including multi-codepoint sequences such as skin tones and flags).
 def is_emoji(content):
     content = content.strip()
     if len(content) > 3:
         return False
-    return all([(character in emoji.UNICODE_EMOJI) for character in content])
+    return "".join(match["emoji"] for match in emoji.emoji_list(content)) == content
+
+
+# Non-ASCII characters that match ASCII letters in case-insensitive expressions.
+CASE_FOLDING_TABLE = str.maketrans({"\u0130": "i", "\u0131": "i", "\u017f": "s", "\u212a": "k"})
+
+
+# Every match of `URL_EXPRESSION` contains a scheme (`http:` or `https:`), or a dot followed by a run of word characters
+# that is a known top-level domain. Checking for these is much cheaper than running the expression itself, and allows us
+# to skip the vast majority of messages which contain no URLs.
+def contains_url_candidate(content):
+    if "." not in content and ":" not in content:
+        return False
+    if not content.isascii():
+        content = content.translate(CASE_FOLDING_TABLE)
+    content = content.lower()
+    if "http:" in content or "https:" in content:
+        return True
+    return any(suffix in TOP_LEVEL_DOMAIN_SET for suffix in DOMAIN_SUFFIX_EXPRESSION.findall(content))
+
+
+def link(match):
+    return f"<a href=\"{match.group(0)}\" target=\"_blank\">{match.group(0)}</a>"
 
 
 def text_to_html(content):
     content = html.escape(content)
-    def replace(match):
-        return f"<a href=\"{match.group(0)}\" target=\"_blank\">{match.group(0)}</a>"
-    content = URL_EXPRESSION.sub(replace, content)
+    if contains_url_candidate(content):
+        content = URL_EXPRESSION.sub(link, content)
     return "".join([f"<p>{line}</p>" for line in content.split("\n")])
 
 
+TAG_EXPRESSION = re.compile(r"<[^>]*>")
+
+
+# Inverse of `text_to_html`, used to index the plain text of messages.
+def html_to_text(content):
+    content = content.replace("</p><p>", "\n")
+    return html.unescape(TAG_EXPRESSION.sub("", content))
+
+
+# Avoids touching files (and their modification times) whose contents haven't changed. Returns true if the file was
+# written.
+def write_if_changed(path, content):
+    try:
+        with open(path) as fh:
+            if fh.read() == content:
+                return False
+    except FileNotFoundError:
+        pass
+    with open(path, "w") as fh:
+        fh.write(content)
+    return True
+
+
+# Preserves the order of first occurrence, so that the result is stable from one run to the next.
 def unique(items):
-    return list(set(items))
+    return list(dict.fromkeys(items))
 
 
 def ensure_timezone(date):
@@ -109,14 +201,145 @@ def parse_date(string):
     return ensure_timezone(date)
 
 
-def copy_attachments(destination, events):
+# Parses dates of the form '<date><separator>HH:MM:SS' where the date component matches one of `date_formats`. Date
+# components are only parsed once, and anything that doesn't match the expected format falls back to `parse_date`.
+class DateParser(object):
+
+    def __init__(self, date_formats, separator):
+        self.date_formats = date_formats
+        self.separator = separator
+        self.dates = {}
+
+    def date(self, string):
+        try:
+            return self.dates[string]
+        except KeyError:
+            pass
+        for date_format in self.date_formats:
+            try:
+                date = datetime.datetime.strptime(string, date_format).date()
+                break
+            except ValueError:
+                pass
+        else:
+            raise ValueError(f"Unsupported date '{string}'.")
+        self.dates[string] = date
+        return date
+
+    def parse(self, string):
+        try:
+            date, separator, time = string.rpartition(self.separator)
+            if not separator:
+                raise ValueError(f"Missing separator in '{string}'.")
+            date = self.date(date)
+            hour, minute, second = time.split(":")
+            return datetime.datetime(date.year, date.month, date.day, int(hour), int(minute), int(second),
+                                     tzinfo=pytz.utc)
+        except ValueError:
+            logging.debug("Falling back to dateutil to parse '%s'.", string)
+            return parse_date(string)
+
+
+class ISODateParser(object):
+
+    def parse(self, string):
+        try:
+            # Python versions prior to 3.11 don't support the 'Z' suffix.
+            if string.endswith("Z"):
+                string = string[:-1] + "+00:00"
+            return ensure_timezone(datetime.datetime.fromisoformat(string))
+        except ValueError:
+            logging.debug("Falling back to dateutil to parse '%s'.", string)
+            return parse_date(string)
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(COPY_BUFFER_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def clone_file(source, destination):
+    # Copy-on-write clones are only available on Linux filesystems supporting FICLONE (e.g., Btrfs and XFS); `fcntl`
+    # doesn't exist on Windows.
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError(errno.EOPNOTSUPP, "Cloning files is not supported on this platform.")
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+# Places a file at `destination` using the cheapest available mechanism: a copy-on-write clone, a hardlink, or, failing
+# those, a copy. The file is placed atomically, so concurrent importers can safely place the same destination.
+def place_file(source, destination):
+    temporary_path = os.path.join(os.path.dirname(destination), f".{uuid.uuid4()}")
+    try:
+        for method in [clone_file, os.link]:
+            try:
+                method(source, temporary_path)
+                break
+            except OSError:
+                if os.path.exists(temporary_path):
+                    os.unlink(temporary_path)
+        else:
+            shutil.copyfile(source, temporary_path)
+        os.replace(temporary_path, destination)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(temporary_path)
+        raise
+
+
+def attachment_basename(digest, path):
+    _, ext = os.path.splitext(path)
+    return digest + ext.lower()
+
+
+# Attachments are stored once in `destination`, named by the SHA-256 digest of their contents.
+def add_attachment(destination, path):
+    basename = attachment_basename(file_digest(path), path)
+    target = os.path.join(destination, basename)
+    if not os.path.exists(target):
+        place_file(path, target)
+    return basename
+
+
+def add_attachment_stream(destination, fh, name):
+    digest = hashlib.sha256()
+    temporary = tempfile.NamedTemporaryFile(dir=destination, prefix=".", delete=False)
+    try:
+        with temporary:
+            for chunk in iter(lambda: fh.read(COPY_BUFFER_SIZE), b""):
+                digest.update(chunk)
+                temporary.write(chunk)
+        os.chmod(temporary.name, ATTACHMENT_MODE)
+        basename = attachment_basename(digest.hexdigest(), name)
+        target = os.path.join(destination, basename)
+        if os.path.exists(target):
+            os.unlink(temporary.name)
+        else:
+            os.replace(temporary.name, target)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(temporary.name)
+        raise
+    return basename
+
+
+# Attachments are read from `archive` (a `zipfile.ZipFile`) if specified, streaming each member directly into the
+# attachment store without extracting the archive.
+def copy_attachments(destination, events, archive=None):
     for event in events:
         if event.type == model.EventType.ATTACHMENT:
-            _, ext = os.path.splitext(event.content)
-            basename = str(uuid.uuid4()) + ext
-            target = os.path.join(destination, basename)
             logging.debug("Copying '%s'...", event.content)
-            shutil.copy(event.content, target)
+            if archive is None:
+                basename = add_attachment(destination, event.content)
+            else:
+                with archive.open(event.content) as fh:
+                    basename = add_attachment_stream(destination, fh, event.content)
             yield model.Attachment(date=event.date,
                                    person=event.person,
                                    content=basename)